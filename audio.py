@@ -0,0 +1,104 @@
+import os
+import struct
+import wave
+
+# reading durations from the file headers in-process, rather than launching
+# ffprobe for every file. ffmpeg.probe remains the fallback for other formats
+
+# mp3 frame header tables, indexed by [version][layer] and [version]
+MP3_BITRATES_KBPS = {
+    "1": {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    "2": {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+MP3_SAMPLE_RATES = {
+    "1": [44_100, 48_000, 32_000],
+    "2": [22_050, 24_000, 16_000],
+    "2.5": [11_025, 12_000, 8_000],
+}
+MP3_HEADER_BYTES = 64 * 1024
+
+
+def get_duration_in_s(full_path):
+    with open(full_path, "rb") as f:
+        head = f.read(MP3_HEADER_BYTES)
+
+    duration_in_s = None
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        duration_in_s = get_wav_duration_in_s(full_path)
+    elif head[:3] == b"ID3" or (len(head) > 1 and head[0] == 0xFF and head[1] >= 0xE0):
+        duration_in_s = get_mp3_duration_in_s(head, os.path.getsize(full_path))
+
+    if duration_in_s is None:
+        import ffmpeg
+
+        duration_in_s = float(ffmpeg.probe(full_path)["format"]["duration"])
+    return duration_in_s
+
+
+def get_wav_duration_in_s(full_path):
+    try:
+        with wave.open(full_path, "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError, ZeroDivisionError):
+        return None  # e.g., not plain pcm
+
+
+def get_mp3_duration_in_s(head, file_size):
+    # skip an ID3v2 tag, whose size is stored as a 4-byte syncsafe integer
+    audio_start = 0
+    if head[:3] == b"ID3" and len(head) >= 10:
+        tag_size = 0
+        for each_byte in head[6:10]:
+            tag_size = (tag_size << 7) | (each_byte & 0x7F)
+        audio_start = 10 + tag_size + (10 if head[5] & 0x10 else 0)
+    if audio_start + 4 > len(head):
+        return None
+
+    header = struct.unpack(">I", head[audio_start : audio_start + 4])[0]
+    if header & 0xFFE00000 != 0xFFE00000:
+        return None
+
+    version = {0: "2.5", 2: "2", 3: "1"}.get((header >> 19) & 0x3)
+    layer = {1: 3, 2: 2, 3: 1}.get((header >> 17) & 0x3)
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0x3
+    is_mono = (header >> 6) & 0x3 == 3
+    if not version or not layer or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    sample_rate = MP3_SAMPLE_RATES[version][sample_rate_index]
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 3 and version != "1":
+        samples_per_frame = 576
+    else:
+        samples_per_frame = 1152
+
+    # a vbr file's first frame may carry a Xing/Info or VBRI header with the frame count
+    if version == "1":
+        side_info_bytes = 17 if is_mono else 32
+    else:
+        side_info_bytes = 9 if is_mono else 17
+    xing_start = audio_start + 4 + side_info_bytes
+    if head[xing_start : xing_start + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", head[xing_start + 4 : xing_start + 8])[0]
+        if flags & 0x1:
+            frame_count = struct.unpack(">I", head[xing_start + 8 : xing_start + 12])[0]
+            return frame_count * samples_per_frame / sample_rate
+    vbri_start = audio_start + 4 + 32
+    if head[vbri_start : vbri_start + 4] == b"VBRI":
+        frame_count = struct.unpack(">I", head[vbri_start + 14 : vbri_start + 18])[0]
+        return frame_count * samples_per_frame / sample_rate
+
+    # otherwise assume a constant bitrate
+    bitrate_version = "1" if version == "1" else "2"
+    bitrate = MP3_BITRATES_KBPS[bitrate_version][layer][bitrate_index] * 1_000
+    return (file_size - audio_start) * 8 / bitrate
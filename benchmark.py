@@ -0,0 +1,432 @@
+import argparse
+import datetime
+import http.server
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import yaml
+
+# benchmarks for benson. three parts:
+#   micro:   the URL/title helpers over a synthetic corpus of URLs
+#   e2e:     a full benson.py run against local http servers serving canned
+#            articles, with the stub tts engine instead of pyttsx3. a stand-in
+#            archive server (127.0.0.250) replaces the real archives, and
+#            --dead-every N makes every Nth origin hang, to measure hedging
+#   imports: how long `import benson` takes, i.e., benson's cold start
+#   compare: diff two results files, e.g., from two commits
+#
+#   python benchmark.py micro --urls 100000
+#   python benchmark.py imports --max-ms 150
+#   python benchmark.py e2e --articles 200 --benson-args "--tts-workers 4"
+#   python benchmark.py e2e --dead-every 10 --setting HEDGE_DELAY_S=1
+#   python benchmark.py compare bench_results/abc1234.json bench_results/def5678.json
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FAKE_HOSTS = [
+    "www.linuxjournal.com",
+    "erikhoel.substack.com",
+    "www2.vanityfair.com",
+    "en.wikipedia.org",
+    "firstthings.com:8080",
+    "blog.example.co.uk",
+    "m.nautil.us",
+    "astralcodexten.substack.com",
+]
+WORDS = (
+    "the a why we stopped making einsteins inside succession drama at scholastic "
+    "theology of fiction article blog p post wp news html php fbclid amp index"
+).split()
+
+
+def make_path_token(rng):
+    r = rng.random()
+    if r < 0.15:
+        return str(rng.choice([1850, 1999, 2005, 2013, 2021, 2022, 2030, 12]))
+    if r < 0.25:
+        return str(rng.randint(1, 40))
+    if r < 0.32:
+        return f"{rng.randint(0, 2**40):x}"
+    if r < 0.40:
+        return str(rng.randint(10_000, 99_999_999))
+    return rng.choice(WORDS)
+
+
+def make_url_corpus(num_urls, seed=7):
+    # deterministic, so results are comparable across commits
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(num_urls):
+        separator = rng.choice(["/", "/", "-", "_", "%2F"])
+        path = "/".join(
+            separator.join(make_path_token(rng) for _ in range(rng.randint(1, 4)))
+            for _ in range(rng.randint(0, 4))
+        )
+        urls.append(
+            f"{rng.choice(['https://', 'http://', ''])}{rng.choice(FAKE_HOSTS)}/{path}"
+            f"{rng.choice(['', '?utm_source=x', '?id=12&fbclid=abc', '%3Fq=1'])}"
+            f"{rng.choice(['', '.html', '/'])}".lower()
+        )
+    return urls
+
+
+def time_best_of(func, repeat):
+    best_s = None
+    for _ in range(repeat):
+        start_s = time.perf_counter()
+        func()
+        elapsed_s = time.perf_counter() - start_s
+        if best_s is None or elapsed_s < best_s:
+            best_s = elapsed_s
+    return best_s
+
+
+def run_micro(num_urls, repeat):
+    # import here, so that e2e and compare don't need settings.yaml in the cwd
+    os.chdir(REPO_DIR)
+    import pronunciations
+    import text_utils
+    import tts
+    import url_analysis
+    import url_utils
+
+    urls = make_url_corpus(num_urls)
+    domains_list = [url_utils.get_domains(url) for url in urls]
+    paths = [
+        url_utils.get_path_of_url(url, domains)
+        for url, domains in zip(urls, domains_list)
+    ]
+    tokens_list = [text_utils.tokenize_string(path) for path in paths]
+    trimmed_list = [url_utils.trim_path_tokens(tokens[:]) for tokens in tokens_list]
+
+    pronunciations.load(os.path.join(REPO_DIR, "domains_pronunciations.txt"))
+
+    cases = {
+        "url_utils.get_domains": lambda: [url_utils.get_domains(u) for u in urls],
+        "text_utils.tokenize_string": lambda: [
+            text_utils.tokenize_string(p) for p in paths
+        ],
+        "url_utils.trim_path_tokens": lambda: [
+            url_utils.trim_path_tokens(t[:]) for t in tokens_list
+        ],
+        "tts.get_spoken_title": lambda: [
+            tts.get_spoken_title(d, t[:]) for d, t in zip(domains_list, trimmed_list)
+        ],
+        "tts.get_domains_pron": lambda: [tts.get_domains_pron(d) for d in domains_list],
+        "pronunciations.get_domains_pron": lambda: [
+            pronunciations.get_domains_pron(d) for d in domains_list
+        ],
+        "text_utils.get_base_filename": lambda: [
+            text_utils.get_base_filename(u) for u in urls
+        ],
+        "url_analysis.analyze_urls": lambda: list(url_analysis.analyze_urls(urls)),
+    }
+
+    results = {}
+    for name, func in cases.items():
+        seconds = time_best_of(func, repeat)
+        results[f"micro.{name}"] = {
+            "seconds": seconds,
+            "per_call_us": seconds / num_urls * 1_000_000,
+        }
+        print(f"{name:32} {seconds / num_urls * 1_000_000:8.2f} us/url")
+    return results
+
+
+def make_article_html(article_index):
+    # a few long articles among many short ones, like a real backlog
+    num_paragraphs = 40 if article_index % 10 == 0 else 6
+    paragraphs = "".join(
+        f"<p>Paragraph {i} of article {article_index}. "
+        + "This sentence is here to give the extractor some real prose to keep. " * 5
+        + "</p>"
+        for i in range(num_paragraphs)
+    )
+    return (
+        f"<html><head><title>Article {article_index}</title></head><body>"
+        f"<nav><a href='/'>home</a></nav><article><h1>Article {article_index}</h1>"
+        f"{paragraphs}</article><footer>canned fixture</footer></body></html>"
+    ).encode("utf-8")
+
+
+DEAD_ORIGIN_HANG_S = 600
+
+
+def start_fixture_servers(num_hosts, latency_ms):
+    # one server per loopback address (127.0.0.1, 127.0.0.2, ...), so that benson
+    # sees several domains. every path returns a canned article after latency_ms,
+    # except /dead/... paths, which hang. the last server is the stand-in archive,
+    # which serves /<original url> like an archive's snapshot of it
+    class ArticleHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency_ms / 1_000)
+            if self.path.startswith("/dead/"):
+                time.sleep(DEAD_ORIGIN_HANG_S)
+                return
+            article_index = int(self.path.split("/articles/")[1].split("/")[0])
+            body = make_article_html(article_index)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    servers = []
+    for host in [f"127.0.0.{i + 1}" for i in range(num_hosts)] + ["127.0.0.250"]:
+        server = http.server.ThreadingHTTPServer((host, 0), ArticleHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def make_work_dir(work_dir, archive_server, setting_overrides):
+    # a scratch copy of the config, with everything benson writes kept inside work_dir
+    with open(os.path.join(REPO_DIR, "settings.yaml"), "r", encoding="utf-8") as f:
+        settings = yaml.safe_load(f)
+    host, port = archive_server.server_address[:2]
+    settings.update(
+        {
+            "OUTPUT_DIR_MP3_FILES": "./mp3_files",
+            "CACHE_DIR": "./cache",
+            "SEGMENT_CACHE_DIR": "./segment_cache",
+            "JOURNAL_PATH": "./journal.sqlite",
+            "LEARNED_PRONUNCIATIONS_PATH": "./learned_pronunciations.json",
+            "SCHEDULER_HISTORY_PATH": "./scheduler_history.json",
+            "TTS_ENGINE": "stub",
+            "ARCHIVE_URL_TEMPLATES": [f"http://{host}:{port}/{{url}}"],
+        }
+    )
+    settings.update(setting_overrides)
+    with open(os.path.join(work_dir, "settings.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(settings, f)
+    shutil.copy(
+        os.path.join(REPO_DIR, "domains_pronunciations.txt"),
+        os.path.join(work_dir, "domains_pronunciations.txt"),
+    )
+
+
+def run_end_to_end(
+    num_articles, num_hosts, latency_ms, benson_args, name, dead_every, settings
+):
+    servers = start_fixture_servers(num_hosts, latency_ms)
+    try:
+        with tempfile.TemporaryDirectory(prefix="benson-bench-") as work_dir:
+            make_work_dir(work_dir, servers[-1], settings)
+            with open(os.path.join(work_dir, "urls.txt"), "w", encoding="utf-8") as f:
+                for i in range(num_articles):
+                    server = servers[i % num_hosts]
+                    host, port = server.server_address[:2]
+                    dead = "dead/" if dead_every and i % dead_every == 0 else ""
+                    f.write(
+                        f"http://{host}:{port}/{dead}articles/{i}/a-canned-article\n"
+                    )
+
+            start_s = time.perf_counter()
+            completed = subprocess.run(
+                [sys.executable, os.path.join(REPO_DIR, "benson.py")]
+                + ["--source", "urls.txt"]
+                + benson_args,
+                cwd=work_dir,
+                capture_output=True,
+                text=True,
+            )
+            seconds = time.perf_counter() - start_s
+            if completed.returncode != 0:
+                print(completed.stdout + completed.stderr)
+                raise RuntimeError(f"benson.py exited with {completed.returncode}")
+
+            mp3_count = len(os.listdir(os.path.join(work_dir, "mp3_files")))
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    print(
+        f"{name}: {num_articles} articles, {mp3_count} mp3s in {seconds:.2f} s"
+        f" ({seconds / num_articles * 1_000:.1f} ms/article)"
+    )
+    return {
+        f"e2e.{name}": {
+            "seconds": seconds,
+            "articles": num_articles,
+            "mp3s": mp3_count,
+            "benson_args": benson_args,
+            "dead_every": dead_every,
+            "settings": settings,
+        }
+    }
+
+
+def run_imports(module_names, repeat, max_ms):
+    # each import runs in a fresh interpreter, minus the interpreter's own startup
+    def time_interpreter(code):
+        best_s = None
+        for _ in range(repeat):
+            start_s = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, check=True)
+            elapsed_s = time.perf_counter() - start_s
+            if best_s is None or elapsed_s < best_s:
+                best_s = elapsed_s
+        return best_s
+
+    baseline_s = time_interpreter("pass")
+    results = {}
+    too_slow = []
+    for module_name in module_names:
+        seconds = max(time_interpreter(f"import {module_name}") - baseline_s, 0.0)
+        results[f"imports.{module_name}"] = {"seconds": seconds}
+        print(f"import {module_name:30} {seconds * 1_000:8.1f} ms")
+        if max_ms and seconds * 1_000 > max_ms:
+            too_slow.append(module_name)
+
+    if too_slow:
+        # show where the time goes
+        importtime = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {too_slow[0]}"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+        ).stderr.splitlines()[1:]
+        importtime.sort(key=lambda line: int(line.split("|")[1]), reverse=True)
+        print("\n".join(importtime[:15]))
+        raise SystemExit(f"importing {', '.join(too_slow)} took over {max_ms} ms")
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def write_results(results, results_path):
+    commit = get_commit()
+    if not results_path:
+        results_path = os.path.join(REPO_DIR, "bench_results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+
+    # merge with earlier runs on the same commit, so micro and e2e can be run separately
+    report = {"commit": commit, "results": {}}
+    if os.path.exists(results_path):
+        with open(results_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    report["commit"] = commit
+    report["timestamp"] = datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    report["python"] = sys.version.split()[0]
+    report["results"].update(results)
+
+    with open(results_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"results written to {results_path}")
+
+
+def compare_results(old_path, new_path):
+    reports = []
+    for each_path in (old_path, new_path):
+        with open(each_path, "r", encoding="utf-8") as f:
+            reports.append(json.load(f))
+    old_results, new_results = reports[0]["results"], reports[1]["results"]
+
+    old_commit, new_commit = reports[0]["commit"], reports[1]["commit"]
+    print(f"{'benchmark':40} {old_commit:>10} {new_commit:>10}  change")
+    for name in sorted(set(old_results) & set(new_results)):
+        old_s = old_results[name]["seconds"]
+        new_s = new_results[name]["seconds"]
+        change = (new_s - old_s) / old_s * 100 if old_s else 0.0
+        print(f"{name:40} {old_s:9.3f}s {new_s:9.3f}s  {change:+6.1f}%")
+    for name in sorted(set(old_results) ^ set(new_results)):
+        print(f"{name:40} (only in one of the files)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for benson.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    micro_parser = subparsers.add_parser("micro", help="URL and title helpers")
+    micro_parser.add_argument("--urls", type=int, default=100_000)
+    micro_parser.add_argument("--repeat", type=int, default=3)
+    micro_parser.add_argument("--out", type=str, help="results file to write")
+
+    e2e_parser = subparsers.add_parser("e2e", help="a full run against local servers")
+    e2e_parser.add_argument("--articles", type=int, default=100)
+    e2e_parser.add_argument("--hosts", type=int, default=4)
+    e2e_parser.add_argument("--latency-ms", type=int, default=100)
+    e2e_parser.add_argument(
+        "--benson-args", type=str, default="", help="extra arguments for benson.py"
+    )
+    e2e_parser.add_argument(
+        "--name", type=str, default="default", help="name of this configuration"
+    )
+    e2e_parser.add_argument(
+        "--dead-every", type=int, default=0, help="make every Nth origin hang"
+    )
+    e2e_parser.add_argument(
+        "--setting",
+        type=str,
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override a settings.yaml value (the value is parsed as yaml)",
+    )
+    e2e_parser.add_argument("--out", type=str, help="results file to write")
+
+    imports_parser = subparsers.add_parser("imports", help="cold-start import time")
+    imports_parser.add_argument(
+        "--modules", type=str, default="benson", help="comma-separated module names"
+    )
+    imports_parser.add_argument("--repeat", type=int, default=5)
+    imports_parser.add_argument(
+        "--max-ms", type=float, default=0, help="fail if an import takes longer"
+    )
+    imports_parser.add_argument("--out", type=str, help="results file to write")
+
+    compare_parser = subparsers.add_parser("compare", help="diff two results files")
+    compare_parser.add_argument("old_results")
+    compare_parser.add_argument("new_results")
+
+    args = parser.parse_args()
+
+    if args.command == "micro":
+        write_results(run_micro(args.urls, args.repeat), args.out)
+    elif args.command == "e2e":
+        results = run_end_to_end(
+            args.articles,
+            args.hosts,
+            args.latency_ms,
+            args.benson_args.split(),
+            args.name,
+            args.dead_every,
+            {
+                key: yaml.safe_load(value)
+                for key, value in (each.split("=", 1) for each in args.setting)
+            },
+        )
+        write_results(results, args.out)
+    elif args.command == "imports":
+        results = run_imports(args.modules.split(","), args.repeat, args.max_ms)
+        write_results(results, args.out)
+    elif args.command == "compare":
+        compare_results(args.old_results, args.new_results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,39 @@
 import argparse
+import collections
+import concurrent.futures
 import datetime
-import ffmpeg
+import itertools
 import logging
+import multiprocessing
 import os
 import pathlib
-import trafilatura
+import queue
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
 
+import audio
+import cache
 import config
 import db
+import db_sqlite
+import encoder
+import extractor
+import fetcher
+import intake
+import journal
+import metrics
 import my_time
+import pronunciations
+import scheduler
+import segments
+import supervisor
 import text_utils
 import tts
+import url_analysis
 import url_utils
 
 
@@ -18,7 +41,7 @@ import url_utils
 
 # setup logger
 logger = logging.getLogger(__name__)
-handler = logging.FileHandler("benson.log", "a", "utf-8")
+handler = logging.FileHandler("benson.log", "a", "utf-8", delay=True)
 handler.setFormatter(
     logging.Formatter(
         f"%(asctime)s %(levelname)-8s %(message)s",
@@ -29,36 +52,1001 @@ logger.setLevel(logging.INFO)
 logger.addHandler(handler)
 
 
-def get_content(orig_url):  # uses trafilatura
-    try:
-        downloaded = trafilatura.fetch_url(orig_url)
-    except Exception as e:
-        print(f"trafilatura error while fetching url {orig_url}: {e}")
+def get_content(
+    orig_url,
+    from_cache=False,
+    completed_stages=None,
+    extract_executor=None,
+    key_url=None,
+):  # runs in a fetcher thread; extraction happens in extract_executor, if given
+    # orig_url is fetched as it was listed. the journal and the cache go by
+    # key_url, its canonical form
+    if completed_stages is None:
+        completed_stages = {}
+    if key_url is None:
+        key_url = orig_url
+    base_filename = text_utils.get_base_filename(key_url.lower())
+    domains = url_utils.get_domains(orig_url.lower())
+    cache_entry = cache.load_entry(key_url)
+    from_archive = False
+
+    if from_cache or (cache_entry and "fetched" in completed_stages):
+        if not cache_entry:
+            print(f"url {orig_url} is not in the cache")
+            return None
+        downloaded = cache_entry["html"]
+    else:
+        fetch_start_ts = time.time()
+        with metrics.timed(orig_url, domains, "fetch") as span:
+            try:
+                if cache_entry:
+                    status, downloaded, headers, source = fetcher.fetch_hedged(
+                        orig_url, cache_entry["etag"], cache_entry["last_modified"]
+                    )
+                else:
+                    status, downloaded, headers, source = fetcher.fetch_hedged(orig_url)
+            except Exception as e:
+                print(f"error while fetching url {orig_url}: {e}")
+                return None
+            span["status"] = status
+            span["source"] = source
+            span["downloaded_bytes"] = len(downloaded or b"")
+
+        if source == "origin" and status in (200, 304):
+            scheduler.record(domains, fetch_s=time.time() - fetch_start_ts)
+        if status == 304 and cache_entry:  # our cached copy is still fresh
+            downloaded = cache_entry["html"]
+        elif status != 200 or not downloaded:
+            print(f"error while fetching url {orig_url}: http status {status}")
+            return None
+        elif source != "origin":  # an archived copy
+            print(f"url {orig_url} was fetched from {source}")
+            # an archive's validators would be wrong for the origin
+            cache.store_page(key_url, downloaded, None, None)
+            cache_entry = None
+            from_archive = True
+        else:
+            cache.store_page(
+                key_url, downloaded, headers.get("ETag"), headers.get("Last-Modified")
+            )
+            cache_entry = None
+            canonical_url = url_utils.find_rel_canonical(downloaded, orig_url)
+            if canonical_url and canonical_url != key_url:
+                journal.record_canonical_url(key_url, canonical_url)
+        journal.record_stage(base_filename, "fetched")
+
+    if cache_entry and cache_entry["extracted"] is not None:
+        return cache_entry["extracted"]
+
+    max_html_bytes = config.settings["EXTRACT_MAX_HTML_BYTES"]
+    if max_html_bytes and len(downloaded) > max_html_bytes:
+        print(
+            f"not extracting content from url {orig_url}: its html is"
+            f" {len(downloaded)} bytes, more than the {max_html_bytes} allowed"
+        )
+        return None
+
+    with metrics.timed(orig_url, domains, "extract") as span:
+        try:
+            if extract_executor:
+                result = extract_executor.submit(
+                    extractor.extract_article, downloaded
+                ).result()
+            else:
+                result = extractor.extract_article(downloaded)
+        except Exception as e:
+            print(f"trafilatura error extracting content from url {orig_url}: {e}")
+            return None
+        span["extracted_chars"] = len(result["text"]) if result else 0
+
+    if result:
+        scheduler.record(domains, chars=len(result["text"]))
+        cache.store_extracted(key_url, result)
+        journal.record_stage(base_filename, "extracted")
+        if result["sitename"] and not from_archive:  # an archive may rename it
+            pronunciations.learn(domains, result["sitename"])
+
+    return result
+
+
+def read_link_entries(source_path):
+    # one URL per line, read as the pipeline asks for them
+    with open(source_path, "r", encoding="utf-8") as f:
+        for each_line in f:
+            each_url = each_line.strip()
+            if each_url:
+                yield ("", each_url, "", "")
+
+
+def count_link_entries(source_path):
+    # for the progress estimate, without holding the file in memory
+    with open(source_path, "r", encoding="utf-8") as f:
+        return sum(1 for each_line in f if each_line.strip())
+
+
+def read_ahead(link_entries, max_entries):
+    # pull entries from the source in a background thread, so that paging
+    # through it overlaps with the work, but never more than max_entries ahead
+    entry_queue = queue.Queue(maxsize=max_entries)
+    end_of_entries = object()
+
+    def fill_queue():
+        try:
+            for link_entry in link_entries:
+                entry_queue.put((link_entry, None))
+        except Exception as e:
+            entry_queue.put((end_of_entries, e))
+        else:
+            entry_queue.put((end_of_entries, None))
+
+    threading.Thread(target=fill_queue, daemon=True).start()
+    while True:
+        link_entry, error = entry_queue.get()
+        if error:
+            raise error
+        if link_entry is end_of_entries:
+            return
+        yield link_entry
+
+
+def remember(recent, key, max_size):
+    # recent: an OrderedDict used as a set of the max_size most recent keys
+    recent[key] = None
+    recent.move_to_end(key)
+    if len(recent) > max_size:
+        recent.popitem(last=False)
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def claim_link_entries(store, worker_id, lease_s, first_batch):
+    # claim further batches only as the pipeline asks for more entries, so rows
+    # aren't held by this worker long before it gets to them
+    batch = first_batch
+    while batch:
+        yield from batch
+        batch = store.claim_urls(
+            worker_id, config.settings["LEASE_BATCH_SIZE"], lease_s
+        )
+
+
+def start_lease_renewer(store, worker_id, lease_s):
+    # keep extending the leases on our claimed rows while we work on them.
+    # returns an event that stops the renewer when set
+    stop_renewing = threading.Event()
+
+    def renew_until_stopped():
+        while not stop_renewing.wait(lease_s / 3):
+            try:
+                store.renew_leases(worker_id, lease_s)
+            except Exception as e:
+                logger.error(f"error while renewing leases for {worker_id}: {e}")
+
+    threading.Thread(target=renew_until_stopped, daemon=True).start()
+    return stop_renewing
+
+
+def get_canonical_url(url):
+    # folds tracking parameters, AMP variants etc. together, then follows any
+    # rel=canonical an earlier fetch of the page named
+    return journal.get_canonical_url(url_utils.canonicalize_url(url))
+
+
+def canonicalize_link_entries(link_entries, store, stats):
+    # rewrite each entry's URL into its canonical form, which names its journal
+    # entries, cache entry and mp3, and skip URLs that turn out to be the same
+    # as one seen recently in this run (the journal catches those seen longer
+    # ago, as already done). the URL as it was listed goes last in the entry,
+    # since that's the one to fetch: the canonical form may not be served
+    seen_urls = collections.OrderedDict()
+    for link_entry in link_entries:
+        canonical_url = get_canonical_url(link_entry[1])
+        if canonical_url in seen_urls:
+            print(f"skipping url {link_entry[1]}: it's the same as {canonical_url}")
+            if store:
+                store.mark_row_as_processing_error_in_db(
+                    int(link_entry[0]), f"duplicate of {canonical_url}"
+                )
+            stats["duplicate_count"] += 1
+            metrics.finish_url("skipped")
+            continue
+        remember(seen_urls, canonical_url, config.settings["DEDUPE_WINDOW"])
+        yield (
+            link_entry[0],
+            canonical_url,
+            link_entry[2],
+            link_entry[3],
+            link_entry[1],
+        )
+
+
+def get_journaled_stages(url):
+    # returns (url, completed stages) for the URL an earlier run journaled this
+    # page under. a page is only found to name a rel=canonical once it's
+    # fetched, so the run that fetched it kept going under the URL it was listed
+    # as, which later runs rewrite to the canonical one
+    completed_stages = journal.get_completed_stages(
+        text_utils.get_base_filename(url.lower())
+    )
+    if completed_stages:
+        return url, completed_stages
+    for listed_url in journal.get_aliases(url):
+        listed_stages = journal.get_completed_stages(
+            text_utils.get_base_filename(listed_url.lower())
+        )
+        if listed_stages:
+            return listed_url, listed_stages
+    return url, completed_stages
+
+
+def attach_completed_stages(link_entries, output_dir, force, from_cache=False):
+    # pair each entry with the stages the journal says it already completed.
+    # --force, --from-cache (which is for re-rendering), or an mp3 that has gone
+    # missing since, means starting from scratch
+    for link_entry in link_entries:
+        url, completed_stages = get_journaled_stages(link_entry[1])
+        link_entry = (link_entry[0], url) + tuple(link_entry[2:])
+        base_filename = text_utils.get_base_filename(url.lower())
+        mp3_full_path = os.path.join(output_dir, f"{base_filename}.mp3")
+        if force or from_cache:
+            completed_stages = {}
+        elif "synthesized" in completed_stages and not os.path.exists(mp3_full_path):
+            completed_stages = {}
+        yield link_entry, completed_stages
+
+
+def interleave_by_domain(entries_with_stages, window_size, quick_wins=False):
+    # reorder each window of entries round-robin by domain, so that clusters of
+    # links to the same site are spread out instead of fetched back to back.
+    # the domains take their turns in the order scheduler.py picks
+    window = []
+    for each_item in entries_with_stages:
+        window.append(each_item)
+        if len(window) == window_size:
+            yield from round_robin_by_domain(window, quick_wins)
+            window = []
+    yield from round_robin_by_domain(window, quick_wins)
+
+
+def round_robin_by_domain(entries_with_stages, quick_wins=False):
+    entries_by_domain = {}
+    for each_item in entries_with_stages:
+        domains = url_utils.get_domains(each_item[0][1].lower())
+        entries_by_domain.setdefault(domains, collections.deque()).append(each_item)
+    costs_and_domains = [
+        (scheduler.estimate_cost(domains), domains) for domains in entries_by_domain
+    ]
+    entries_by_domain = collections.OrderedDict(
+        (domains, entries_by_domain[domains])
+        for domains in scheduler.order_by_cost(costs_and_domains, quick_wins)
+    )
+    while entries_by_domain:
+        for domains in list(entries_by_domain):
+            yield entries_by_domain[domains].popleft()
+            if not entries_by_domain[domains]:
+                del entries_by_domain[domains]
+
+
+def make_extract_executor(extract_workers, ignore_stop_signals=False, supervise=False):
+    # None means extracting in the fetcher threads
+    if supervise:  # always in child processes
+        return supervisor.SupervisedPool(
+            "extract",
+            max(extract_workers, 1),
+            config.settings["SUPERVISE_EXTRACT_TIMEOUT_S"],
+            extractor.start_worker,
+            (ignore_stop_signals,),
+        )
+    if not extract_workers:
         return None
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=extract_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=extractor.start_worker,
+        initargs=(ignore_stop_signals,),
+    )
+
 
+def prefetch_content(
+    entries_with_stages, fetch_concurrency, from_cache=False, extract_executor=None
+):
+    # fetch and extract up to fetch_concurrency URLs ahead of the consumer, so
+    # network round trips overlap with synthesis. entries are yielded in source
+    # order together with their completed stages and their content (or None on
+    # failure, or when the article was synthesized already)
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=fetch_concurrency
+    ) as executor:
+        in_flight = collections.deque()
+        for link_entry, completed_stages in entries_with_stages:
+            if "synthesized" in completed_stages:
+                future = None
+            else:
+                future = executor.submit(
+                    get_content,
+                    link_entry[4],
+                    from_cache,
+                    completed_stages,
+                    extract_executor,
+                    link_entry[1],
+                )
+            in_flight.append((link_entry, completed_stages, future))
+            if len(in_flight) > fetch_concurrency:
+                yield get_prefetch_result(*in_flight.popleft())
+        while in_flight:
+            yield get_prefetch_result(*in_flight.popleft())
+
+
+def get_prefetch_result(link_entry, completed_stages, future):
+    if future is None:
+        return link_entry, completed_stages, None
+    return link_entry, completed_stages, future.result()
+
+
+def describe_entry(link_entry):
+    # everything about an entry that can be known without fetching it
+    if link_entry[0]:
+        row_id = int(link_entry[0])
+    else:
+        row_id = 0
+
+    orig_url = link_entry[1]
+    url = orig_url.lower()
+
+    url_info = url_analysis.analyze_url(url)
+    domains = url_info["domains"]
+    domains_pron = pronunciations.get_domains_pron(domains)
+
+    return {
+        "row_id": row_id,
+        "url": url,
+        "domains": domains,
+        "domains_pron": domains_pron,
+        "spoken_title": url_info["spoken_title"],
+        "base_filename": url_info["base_filename"],
+        "date_emailed": link_entry[2],
+        # "date_loaded": link_entry[3],  # this column is in my database, but it doesn't get used
+    }
+
+
+def print_plan(link_entries, output_dir, force, from_cache=False):
+    # what a run would do, without fetching, synthesizing or claiming anything
+    status_count = collections.Counter()
+    link_entries = (
+        (link_entry[0], get_canonical_url(link_entry[1])) + tuple(link_entry[2:])
+        for link_entry in link_entries
+    )
+    for link_entry, completed_stages in attach_completed_stages(
+        link_entries, output_dir, force, from_cache
+    ):
+        entry = describe_entry(link_entry)
+        if "probed" in completed_stages:
+            status = "done"
+        elif completed_stages:
+            status = "resume"
+        else:
+            status = "new"
+        status_count[status] += 1
+        print(
+            f"{status:6} {entry['base_filename']}.mp3\n"
+            f"       {entry['domains_pron']}: {entry['spoken_title']}"
+        )
+    print(
+        f"\nPlan: {sum(status_count.values())} URLs, {status_count['new']} new,"
+        f" {status_count['resume']} to resume, {status_count['done']} already done"
+    )
+
+
+def prepare_job(link_entry, completed_stages, article, output_dir, run_contents):
+    # article: as get_content() returned it. run_contents: hashes of the article
+    # texts this run has claimed recently
+    entry = describe_entry(link_entry)
+    url = entry["url"]
+    domains_pron = entry["domains_pron"]
+    date_emailed = entry["date_emailed"]
+
+    # the page's own title and date where it has them, else what the URL's path
+    # suggests
+    title = entry["spoken_title"]
+    spoken_title = entry["spoken_title"]
+    published = None
+    author = None
+    if article and article.get("title"):
+        title = article["title"]
+        published = my_time.parse_iso_date(article.get("date"))
+        spoken_title = title
+        if published:
+            published_on = my_time.pretty_date(published)
+            spoken_title += f", and it was published on {published_on}"
+        author = article.get("author")
+
+    # (sentence, whether it's the same for every article from a site, or from a
+    # day, so that its audio can come from the segment cache)
+    title_sentence = f"Its title is {spoken_title}."
+    if author:
+        title_sentence = f"Its title is {spoken_title}. It was written by {author}."
+    intro = [
+        (f"The next article is from {domains_pron}.", True),
+        (title_sentence, False),
+    ]
+    if date_emailed:
+        intro.append(
+            (f"It was saved via email on {my_time.pretty_date(date_emailed)}.", True)
+        )
+    intro.append(
+        (
+            f"It was digitized to audio on"
+            f" {my_time.pretty_date(datetime.datetime.now())}.",
+            True,
+        )
+    )
+
+    base_filename = entry["base_filename"]
+    mp3_filename = f"{base_filename}.mp3"
+    tag_date = published or date_emailed or datetime.datetime.now()
+
+    job = {
+        "row_id": entry["row_id"],
+        "url": url,
+        "domains": entry["domains"],
+        "base_filename": base_filename,
+        "mp3_full_path": os.path.join(output_dir, mp3_filename),
+        "completed_stages": completed_stages,
+        "intro": intro,
+        "text": None,  # the article, which follows the intro
+        "tags": {
+            "title": title,
+            "artist": domains_pron,
+            "album": "Benson",
+            "date": tag_date.strftime("%Y-%m-%d"),
+            "comment": link_entry[4],
+        },
+        "content_hash": None,
+        "duplicate_of": None,
+        "error": None,
+    }
+
+    if "synthesized" in completed_stages:
+        pass  # nothing left to render
+    elif not article:
+        job["error"] = "error getting content from url"
+    else:
+        job["duplicate_of"] = claim_content(
+            job, article["text"], output_dir, run_contents
+        )
+        if not job["duplicate_of"]:
+            job["text"] = article["text"]
+
+    return job
+
+
+def claim_content(job, story_content, output_dir, run_contents):
+    # returns the URL of an earlier article with the same text, if that one was
+    # rendered already or is being rendered by this run; otherwise records this
+    # job as the one that has this text
+    content_hash = text_utils.get_content_hash(story_content)
+    first_base_filename, first_url = journal.claim_content(
+        content_hash, job["base_filename"], job["url"]
+    )
+    if first_base_filename != job["base_filename"]:
+        first_mp3_exists = os.path.exists(
+            os.path.join(output_dir, f"{first_base_filename}.mp3")
+        )
+        if get_canonical_url(first_url) == get_canonical_url(job["url"]):
+            # the same page, from before it was known by its rel=canonical
+            first_stages = journal.get_completed_stages(first_base_filename)
+            if "probed" in first_stages and first_mp3_exists:
+                job["completed_stages"] = first_stages  # i.e., already done
+                return None
+        elif content_hash in run_contents or first_mp3_exists:
+            return first_url
+        # that article's mp3 is gone, so this job takes over
+        journal.release_content(content_hash, first_base_filename)
+        journal.claim_content(content_hash, job["base_filename"], job["url"])
+    remember(run_contents, content_hash, config.settings["DEDUPE_WINDOW"])
+    job["content_hash"] = content_hash
+    return None
+
+
+def get_synthesis_cost(job):
+    if not needs_synthesis(job):
+        return None
+    return scheduler.estimate_synthesis_s(job["domains"], len(job["text"]))
+
+
+def needs_synthesis(job):
+    return (
+        not job["error"]
+        and not job["duplicate_of"]
+        and "synthesized" not in job["completed_stages"]
+    )
+
+
+def synthesize_task(text, full_path):
+    # runs in the main process or in a tts worker process. returns (error or
+    # None, start timestamp, end timestamp)
+    start_ts = time.time()
     try:
-        result = trafilatura.extract(downloaded, include_comments=False)
+        tts.synthesize_to_file(text, full_path)
     except Exception as e:
-        print(f"trafilatura error extracting content from url {orig_url}: {e}")
-        return None
+        return f"error while converting to mp3 file: {e}", start_ts, time.time()
+    return None, start_ts, time.time()
 
-    return result
+
+def record_synthesis_span(job, text, start_ts, end_ts):
+    job["synthesis_s"] += end_ts - start_ts
+    metrics.record_span(
+        job["url"], job["domains"], "synthesize", start_ts, end_ts, chars=len(text)
+    )
 
 
-if __name__ == "__main__":
+def start_synthesis(job, chunk_chars):
+    # a job is rendered into one or more audio parts that the encode stage turns
+    # into the mp3: the intro sentences, most of which usually come from the
+    # segment cache, and the article, split into chunks when chunking is on and
+    # it's long enough. returns the (text, audio file) pairs to synthesize
+    job["synthesis_errors"] = []
+    job["synthesis_s"] = 0.0  # summed over the job's parts, wherever they ran
+    job["chunk_dir"] = None
+    job["new_segments"] = []  # (text, audio file) to add to the segment cache
+
+    if segments.is_enabled():
+        intro = job["intro"]
+        text = job["text"]
+    else:
+        intro = []
+        intro_text = "\n\n".join(sentence for sentence, cacheable in job["intro"])
+        text = intro_text + "\n\n" + job["text"]
+    if not chunk_chars or len(text) <= chunk_chars:
+        chunks = [text]
+    else:
+        chunks = text_utils.split_into_chunks(text, chunk_chars)
+
+    job["chunk_dir"] = tempfile.mkdtemp(prefix="benson-")
+    job["tasks"] = []
+    job["parts"] = []  # every audio file that goes into the mp3, in order
+    for i, (sentence, cacheable) in enumerate(intro):
+        segment_path = segments.load_segment(sentence) if cacheable else None
+        if not segment_path:
+            segment_path = os.path.join(job["chunk_dir"], f"intro-{i}.wav")
+            job["tasks"].append((sentence, segment_path))
+            if cacheable:
+                job["new_segments"].append((sentence, segment_path))
+        job["parts"].append(segment_path)
+    for i, chunk in enumerate(chunks):
+        chunk_path = os.path.join(job["chunk_dir"], f"{i:05d}.wav")
+        job["tasks"].append((chunk, chunk_path))
+        job["parts"].append(chunk_path)
+    job["pending_tasks"] = len(job["tasks"])
+    return job["tasks"]
+
+
+def finish_synthesis(job):
+    if job["synthesis_errors"]:
+        job["error"] = job["synthesis_errors"][0]
+    else:
+        try:
+            for segment_text, segment_path in job["new_segments"]:
+                segments.store_segment(segment_text, segment_path)
+        except Exception as e:  # the segment cache is only a speedup
+            logger.error(f"error while caching intro segments: {e}")
+    if job["error"]:
+        shutil.rmtree(job["chunk_dir"], ignore_errors=True)
+    return job
+
+
+def encode_job(job):  # runs in an encoder thread
+    with metrics.timed(job["url"], job["domains"], "encode") as span:
+        try:
+            encoder.encode_to_mp3(job["parts"], job["mp3_full_path"], job["tags"])
+            span["mp3_bytes"] = os.path.getsize(job["mp3_full_path"])
+        except Exception as e:
+            job["error"] = f"error while encoding mp3 file: {e}"
+        finally:
+            shutil.rmtree(job["chunk_dir"], ignore_errors=True)
+    return job
+
+
+def encode_jobs(jobs, encode_workers):
+    # encode synthesized jobs in a thread pool (the work happens in ffmpeg
+    # processes), so that encoding one article overlaps synthesizing the next.
+    # jobs are yielded in the order they arrive
+    with concurrent.futures.ThreadPoolExecutor(max_workers=encode_workers) as executor:
+        in_flight = collections.deque()
+        for job in jobs:
+            if not needs_synthesis(job):
+                future = None
+            else:
+                future = executor.submit(encode_job, job)
+            in_flight.append((job, future))
+            if len(in_flight) > encode_workers:
+                yield get_encode_result(*in_flight.popleft())
+        while in_flight:
+            yield get_encode_result(*in_flight.popleft())
+
+
+def get_encode_result(job, future):
+    if future is None:
+        return job
+    return future.result()
+
+
+def collect_synthesis_results(in_flight, done):
+    for future in done:
+        job, text = in_flight.pop(future)
+        try:
+            error, start_ts, end_ts = future.result()
+            record_synthesis_span(job, text, start_ts, end_ts)
+        except Exception as e:  # e.g., a worker process died
+            error = f"error while converting to mp3 file: {e}"
+        if error:
+            job["synthesis_errors"].append(error)
+        job["pending_tasks"] -= 1
+        if job["pending_tasks"] == 0:
+            yield finish_synthesis(job)
+
+
+def start_tts_worker(ignore_stop_signals=False):  # runs in each tts worker process
+    tts.start()
+    if ignore_stop_signals:  # on SIGTERM, `serve` lets the workers finish their jobs
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def make_tts_executor(tts_workers, ignore_stop_signals=False, supervise=False):
+    if supervise:
+        return supervisor.SupervisedPool(
+            "synthesize",
+            tts_workers,
+            config.settings["SUPERVISE_SYNTHESIZE_TIMEOUT_S"],
+            start_tts_worker,
+            (ignore_stop_signals,),
+        )
+    if tts.can_run_in_threads():  # the engine runs outside python, e.g. espeak-ng
+        return concurrent.futures.ThreadPoolExecutor(max_workers=tts_workers)
+    # spawn rather than fork: the fetcher threads are already running by now
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=tts_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=start_tts_worker,
+        initargs=(ignore_stop_signals,),
+    )
+
+
+def synthesize_jobs(jobs, tts_workers, chunk_chars, tts_executor=None):
+    # yield each job once its mp3 has been written (or job["error"] is set).
+    # with more than one worker, each worker process owns its own tts engine and
+    # jobs are yielded in completion order rather than source order. pass a
+    # tts_executor to keep its workers (and their engines) across calls, or to
+    # keep synthesis out of this process even with one worker
+    if tts_workers == 1 and tts_executor is None:
+        for job in jobs:
+            if needs_synthesis(job):
+                # all of a job's parts at once, which lets the backend run them
+                # together (see tts.synthesize_batch)
+                tasks = start_synthesis(job, chunk_chars)
+                start_ts = time.time()
+                errors = tts.synthesize_batch(tasks)
+                all_text = "".join(text for text, full_path in tasks)
+                record_synthesis_span(job, all_text, start_ts, time.time())
+                job["synthesis_errors"].extend(
+                    f"error while converting to mp3 file: {e}" for e in errors if e
+                )
+                finish_synthesis(job)
+            yield job
+        return
+
+    if tts_executor is None:
+        with make_tts_executor(tts_workers) as tts_executor:
+            yield from synthesize_in_pool(jobs, tts_workers, chunk_chars, tts_executor)
+    else:
+        yield from synthesize_in_pool(jobs, tts_workers, chunk_chars, tts_executor)
+
+
+def synthesize_in_pool(jobs, tts_workers, chunk_chars, tts_executor):
+    in_flight = {}
+    for job in jobs:
+        if not needs_synthesis(job):
+            yield job
+            continue
+        for text, full_path in start_synthesis(job, chunk_chars):
+            future = tts_executor.submit(synthesize_task, text, full_path)
+            in_flight[future] = (job, text)
+            # keep the queue short but never empty
+            if len(in_flight) >= 2 * tts_workers:
+                done, _ = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                yield from collect_synthesis_results(in_flight, done)
+    yield from collect_synthesis_results(
+        in_flight, concurrent.futures.as_completed(list(in_flight))
+    )
+
+
+def process_link_entries(
+    link_entries,
+    store,
+    output_dir,
+    fetch_concurrency,
+    tts_workers,
+    chunk_chars,
+    encode_workers,
+    from_cache=False,
+    force=False,
+    tts_executor=None,
+    extract_executor=None,
+    quick_wins=False,
+):
+    # fetch, extract, synthesize, encode and probe each entry, marking database
+    # rows as we go when there's a store. returns the run's tallies
+    stats = {
+        "mp3_count": 0,
+        "mp3_duration_in_s": 0.0,
+        "mp3_size_in_bytes": 0,  # only counts files written by this run
+        "problem_count": 0,
+        "skipped_count": 0,
+        "duplicate_count": 0,
+    }
+    run_contents = collections.OrderedDict()
+
+    jobs = (
+        prepare_job(cur_link_entry, completed_stages, article, output_dir, run_contents)
+        for cur_link_entry, completed_stages, article in prefetch_content(
+            interleave_by_domain(
+                attach_completed_stages(
+                    canonicalize_link_entries(link_entries, store, stats),
+                    output_dir,
+                    force,
+                    from_cache,
+                ),
+                config.settings["FETCH_INTERLEAVE_WINDOW"],
+                quick_wins,
+            ),
+            fetch_concurrency,
+            from_cache,
+            extract_executor,
+        )
+    )
+
+    jobs = scheduler.schedule(
+        jobs, config.settings["SCHEDULE_WINDOW"], get_synthesis_cost, quick_wins
+    )
+
+    for job in encode_jobs(
+        synthesize_jobs(jobs, tts_workers, chunk_chars, tts_executor), encode_workers
+    ):
+
+        # if stats["mp3_count"] == 3:  # a rate limiter for during debugging
+        #     break
+
+        if job["error"]:
+            logger.error(f"{job['error']} {job['url']}")
+            if store:
+                store.mark_row_as_processing_error_in_db(job["row_id"], job["error"])
+            stats["problem_count"] += 1
+            metrics.finish_url("error")
+            if job["content_hash"]:  # let a later copy of the article have a go
+                journal.release_content(job["content_hash"], job["base_filename"])
+            continue
+
+        if job["duplicate_of"]:
+            print(f"skipping url {job['url']}: same text as {job['duplicate_of']}")
+            if store:
+                store.mark_row_as_processing_error_in_db(
+                    job["row_id"], f"duplicate of {job['duplicate_of']}"
+                )
+            stats["duplicate_count"] += 1
+            metrics.finish_url("skipped")
+            continue
+
+        if "probed" in job["completed_stages"]:  # finished in an earlier run
+            stats["skipped_count"] += 1
+            if store:
+                store.mark_row_as_processed_in_db(job["row_id"])
+            metrics.finish_url("skipped")
+            continue
+
+        # presumably success by this point
+        journal.record_stage(job["base_filename"], "synthesized")
+        stats["mp3_count"] += 1
+        with metrics.timed(job["url"], job["domains"], "probe") as span:
+            duration_in_s = audio.get_duration_in_s(job["mp3_full_path"])
+            span["audio_seconds"] = duration_in_s
+        stats["mp3_duration_in_s"] += duration_in_s
+        stats["mp3_size_in_bytes"] += os.path.getsize(job["mp3_full_path"])
+        journal.record_stage(job["base_filename"], "probed", duration_in_s)
+        if job["text"] and duration_in_s:  # synthesized by this run
+            spoken_chars = len(job["text"]) + sum(
+                len(sentence) for sentence, cacheable in job["intro"]
+            )
+            scheduler.record(
+                job["domains"], audio_s_per_char=duration_in_s / spoken_chars
+            )
+            scheduler.record_synthesis(job["synthesis_s"], duration_in_s)
+
+        if store:
+            store.mark_row_as_processed_in_db(job["row_id"])
+        metrics.finish_url("ok")
+
+    scheduler.save_history()
+    return stats
+
+
+def evict_caches():
+    cache.evict_lru(config.settings["CACHE_DIR"], config.settings["CACHE_MAX_BYTES"])
+    if segments.is_enabled():
+        cache.evict_lru(
+            config.settings["SEGMENT_CACHE_DIR"],
+            config.settings["SEGMENT_CACHE_MAX_BYTES"],
+        )
+
+
+def load_domains_pronunciations(domains_pron, write_index=True):
+    # returns False if an explicitly given pronunciation file can't be used
+    if domains_pron:
+        domains_pron_str = str(domains_pron[0])
+        if os.path.exists(domains_pron_str):
+            try:
+                pronunciations.load(domains_pron_str, write_index)
+            except Exception as e:
+                logger.error(
+                    f"could not read domains pronunciation file {domains_pron_str}! aborting"
+                )
+                return False
+        else:
+            logger.error(
+                f"domains pronunciation file {domains_pron_str} doesn't exist! aborting"
+            )
+            return False
+    else:  # try for default file
+        if os.path.exists("domains_pronunciations.txt"):
+            pronunciations.load("domains_pronunciations.txt", write_index)
+        else:
+            logger.info(f"no domains pronunciation file specified and no default found")
+    return True
+
+
+def serve(
+    output_dir,
+    fetch_concurrency,
+    tts_workers,
+    chunk_chars,
+    encode_workers,
+    extract_workers,
+    domains_pron,
+    http_port,
+    from_cache=False,
+    force=False,
+    metrics_out=None,
+    quick_wins=False,
+    supervise=False,
+):
+    # keep running, with trafilatura and the tts engine(s) loaded, and process
+    # URLs as they are submitted (see intake.py). SIGTERM or ctrl-c stops
+    # taking new work; whatever was claimed already is finished first
+    store = db_sqlite  # the local queue, whatever DB_BACKEND says
+    worker_id = get_worker_id()
+    lease_s = config.settings["LEASE_S"]
+    spool_dir = config.settings["SPOOL_DIR"]
+    poll_s = config.settings["SERVE_POLL_S"]
+    os.makedirs(spool_dir, exist_ok=True)
+
+    stop_serving = threading.Event()
+
+    def request_stop(signum, frame):
+        if not stop_serving.is_set():
+            print("\nstopping after the current batch")
+            logger.info(f"got signal {signum}, draining")
+        stop_serving.set()
+        intake.work_available.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # pay for the slow imports and engine startup now, not on the first submission
+    extract_executor = make_extract_executor(
+        extract_workers, ignore_stop_signals=True, supervise=supervise
+    )
+    if not extract_executor:
+        import trafilatura
+
+    tts_executor = None
+    if tts_workers > 1 or supervise:
+        tts_executor = make_tts_executor(
+            tts_workers, ignore_stop_signals=True, supervise=supervise
+        )
+    if tts_executor is None or isinstance(
+        tts_executor, concurrent.futures.ThreadPoolExecutor
+    ):
+        tts.start()  # synthesis happens in this process
+
+    http_server = None
+    if http_port:
+        http_server = intake.start_http_server(http_port)
+        print(f"accepting URLs at http://127.0.0.1:{http_port}/urls")
+    print(f"watching {spool_dir} for URL files")
+
+    stop_renewing = start_lease_renewer(store, worker_id, lease_s)
+    metrics.start_run(metrics_out)
+    try:
+        while not stop_serving.is_set():
+            intake.work_available.clear()
+            try:
+                intake.ingest_spool(spool_dir)
+                link_entries = store.claim_urls(
+                    worker_id, config.settings["LEASE_BATCH_SIZE"], lease_s
+                )
+                if not link_entries:
+                    intake.work_available.wait(poll_s)
+                    continue
+
+                # cheap unless the file changed
+                load_domains_pronunciations(domains_pron)
+                batch_start_ts = my_time.get_time_now_in_seconds()
+                stats = process_link_entries(
+                    link_entries,
+                    store,
+                    output_dir,
+                    fetch_concurrency,
+                    tts_workers,
+                    chunk_chars,
+                    encode_workers,
+                    from_cache,
+                    force,
+                    tts_executor,
+                    extract_executor,
+                    quick_wins,
+                )
+                print(
+                    f"batch of {len(link_entries)} URLs done in"
+                    f" {my_time.pretty_print_duration(my_time.get_time_now_in_seconds() - batch_start_ts)}:"
+                    f" {stats['mp3_count']} mp3s, {stats['problem_count']} problems,"
+                    f" {stats['skipped_count']} skipped,"
+                    f" {stats['duplicate_count']} duplicates"
+                )
+                if supervise:
+                    print(supervisor.get_summary())
+                evict_caches()
+            except Exception as e:  # whatever it was, keep serving
+                print(f"error while serving a batch, trying again in {poll_s} s: {e}")
+                logger.error(f"error while serving a batch: {e}")
+                store.release_leases(worker_id)  # so the rows are claimed again
+                stop_serving.wait(poll_s)
+    finally:
+        if http_server:
+            http_server.shutdown()
+        if tts_executor:
+            tts_executor.shutdown(wait=True)
+        if extract_executor:
+            extract_executor.shutdown(wait=True)
+        stop_renewing.set()
+        store.flush_status_updates()
+        metrics.finish_run()
+
+
+def main():
 
     # setup parser and get command line arguments
     parser = argparse.ArgumentParser(
         description="Convert a list of URLs to their content as mp3s."
     )
+    parser.add_argument(
+        "mode",
+        nargs="?",
+        choices=["run", "serve"],
+        default="run",
+        help="run: process --source and exit (the default); serve: keep running and process URLs as they are submitted",
+    )
     parser.add_argument(
         "--source",
         "-s",
         metavar="SOURCE",
         type=str,
         nargs=1,
-        required=True,
-        help="either a keyword or a filename",
+        required=False,
+        help="either a keyword or a filename (required unless serving)",
     )
     parser.add_argument(
         "--output_dir",
@@ -78,11 +1066,147 @@ if __name__ == "__main__":
         required=False,
         help="pronunciations of domain names",
     )
+    parser.add_argument(
+        "--fetch-concurrency",
+        "-fc",
+        metavar="N",
+        type=int,
+        nargs=1,
+        required=False,
+        help="how many URLs to fetch ahead of text-to-speech (default: 4)",
+    )
+    parser.add_argument(
+        "--tts-workers",
+        "-tw",
+        metavar="N",
+        type=int,
+        nargs=1,
+        required=False,
+        help="how many text-to-speech worker processes to run (default: 1)",
+    )
+    parser.add_argument(
+        "--chunk-chars",
+        "-cc",
+        metavar="N",
+        type=int,
+        nargs=1,
+        required=False,
+        help="split articles longer than N characters into chunks that are synthesized in parallel (default: 0, i.e., off)",
+    )
+    parser.add_argument(
+        "--extract-workers",
+        "-xw",
+        metavar="N",
+        type=int,
+        nargs=1,
+        required=False,
+        help="how many processes extract article text from html; 0 extracts in the fetcher threads (default: 2)",
+    )
+    parser.add_argument(
+        "--encode-workers",
+        "-ew",
+        metavar="N",
+        type=int,
+        nargs=1,
+        required=False,
+        help="how many mp3s to encode at once, alongside text-to-speech (default: 2)",
+    )
+    parser.add_argument(
+        "--worker-id",
+        metavar="ID",
+        type=str,
+        nargs=1,
+        required=False,
+        help="name under which to claim rows from the database (default: hostname-pid)",
+    )
+    parser.add_argument(
+        "--from-cache",
+        action="store_true",
+        help="don't touch the network; re-render articles from the local cache only",
+    )
+    parser.add_argument(
+        "--metrics-out",
+        metavar="PREFIX",
+        type=str,
+        required=False,
+        help="write per-stage timings to PREFIX.jsonl and Prometheus metrics to PREFIX.prom",
+    )
+    parser.add_argument(
+        "--plan",
+        "--dry-run",
+        action="store_true",
+        help="list the URLs, titles and filenames a run would produce, then stop",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="redo every URL, even those the journal says were finished already",
+    )
+    parser.add_argument(
+        "--quick-wins",
+        action="store_true",
+        help="do the articles expected to be quickest first, instead of the slowest",
+    )
+    parser.add_argument(
+        "--supervise",
+        action="store_true",
+        help="extract and synthesize in child processes that are recycled and timed out",
+    )
+    parser.add_argument(
+        "--http-port",
+        metavar="N",
+        type=int,
+        nargs=1,
+        required=False,
+        help="when serving, also accept URLs POSTed to http://127.0.0.1:N/urls (default: off)",
+    )
 
     args = parser.parse_args()
+    if args.mode == "run" and not args.source:
+        parser.error("the following arguments are required: --source/-s")
     source = args.source
     domains_pron = args.domains_pron
 
+    if args.fetch_concurrency:
+        fetch_concurrency = args.fetch_concurrency[0]
+        if fetch_concurrency < 1:
+            logger.error(f"fetch concurrency must be at least 1! aborting")
+            exit(1)
+    else:
+        fetch_concurrency = config.settings["FETCH_CONCURRENCY"]
+
+    if args.tts_workers:
+        tts_workers = args.tts_workers[0]
+        if tts_workers < 1:
+            logger.error(f"tts workers must be at least 1! aborting")
+            exit(1)
+    else:
+        tts_workers = config.settings["TTS_WORKERS"]
+
+    if args.chunk_chars:
+        chunk_chars = args.chunk_chars[0]
+        if chunk_chars < 0:
+            logger.error(f"chunk size can't be negative! aborting")
+            exit(1)
+    else:
+        chunk_chars = config.settings["CHUNK_CHARS"]
+
+    if args.encode_workers:
+        encode_workers = args.encode_workers[0]
+        if encode_workers < 1:
+            logger.error(f"encode workers must be at least 1! aborting")
+            exit(1)
+    else:
+        encode_workers = config.settings["ENCODE_WORKERS"]
+
+    if args.extract_workers:
+        extract_workers = args.extract_workers[0]
+        if extract_workers < 0:
+            logger.error(f"extract workers can't be negative! aborting")
+            exit(1)
+    else:
+        extract_workers = config.settings["EXTRACT_WORKERS"]
+
     if args.output_dir:
         output_dir_str = str(args.output_dir[0])
         if not os.path.isdir(pathlib.Path(output_dir_str)):
@@ -93,187 +1217,161 @@ if __name__ == "__main__":
     else:
         output_dir = config.settings["OUTPUT_DIR_MP3_FILES"]
 
+    if config.settings["TTS_ENGINE"] not in tts.BACKEND_MODULES:
+        logger.error(f"unknown TTS_ENGINE {config.settings['TTS_ENGINE']}! aborting")
+        exit(1)
+
+    if not args.plan:
+        config.ensure_required_directories()
+
+    if args.mode == "serve":
+        if not load_domains_pronunciations(domains_pron):
+            exit(1)
+        if args.http_port:
+            http_port = args.http_port[0]
+        else:
+            http_port = config.settings["SERVE_HTTP_PORT"]
+        serve(
+            output_dir,
+            fetch_concurrency,
+            tts_workers,
+            chunk_chars,
+            encode_workers,
+            extract_workers,
+            domains_pron,
+            http_port,
+            args.from_cache,
+            args.force,
+            args.metrics_out,
+            args.quick_wins,
+            args.supervise,
+        )
+        return
+
     # initialize timing variables
     start_ts = my_time.get_time_now_in_seconds()
     start_dt = my_time.get_cur_datetime()
 
     # get list of URLs from source
     source_str = str(source[0])
+    store = None  # the db backend, when the source is the database
     if source_str.lower() == "database":
-        link_entries = db.get_urls_from_db()
+        if config.settings["DB_BACKEND"] == "sqlite":
+            store = db_sqlite
+        else:
+            store = db
+        if args.plan:  # look, but don't claim
+            link_entries = read_ahead(
+                store.get_urls_from_db(), config.settings["SOURCE_QUEUE_SIZE"]
+            )
+        else:
+            worker_id = args.worker_id[0] if args.worker_id else get_worker_id()
+            lease_s = config.settings["LEASE_S"]
+            lease_batch_size = config.settings["LEASE_BATCH_SIZE"]
+            first_batch = store.claim_urls(worker_id, lease_batch_size, lease_s)
+            if not first_batch:
+                logger.error(f"no unclaimed URLs in the database! aborting")
+                exit(1)
+            stop_renewing = start_lease_renewer(store, worker_id, lease_s)
+            # claim at most one batch ahead of the pipeline
+            link_entries = read_ahead(
+                claim_link_entries(store, worker_id, lease_s, first_batch),
+                lease_batch_size,
+            )
     else:
         if os.path.exists(source_str):
             try:
-                with open(source_str, "r", encoding="utf-8") as f:
-                    list_of_urls = f.read().splitlines()
-                    if not list_of_urls:
-                        logger.error(f"file {source_str} is empty! aborting")
-                        exit(1)
+                url_count = count_link_entries(source_str)
+                if not url_count:
+                    logger.error(f"file {source_str} is empty! aborting")
+                    exit(1)
             except Exception as e:
                 logger.error(f"error while reading {source_str}! aborting")
                 exit(1)
-            link_entries = []
-            for each_url in list_of_urls:
-                if not each_url:
-                    continue
-                link_entries.append(("", each_url, "", ""))
+            link_entries = read_ahead(
+                read_link_entries(source_str), config.settings["SOURCE_QUEUE_SIZE"]
+            )
         else:
             logger.error(f"file {source_str} not found! aborting")
             exit(1)
 
-    if not link_entries:
+    first_entry = next(link_entries, None)
+    if first_entry is None:
         logger.error(f"could not load any URLs! aborting")
         exit(1)
+    link_entries = itertools.chain([first_entry], link_entries)
 
     # ingest pronunciations for domains
-    domains_pronunciations = {}
-    if domains_pron:
-        domains_pron_str = str(domains_pron[0])
-        if os.path.exists(domains_pron_str):
-            try:
-                with open(domains_pron_str) as f:
-                    lines = f.read().splitlines()
-            except Exception as e:
-                logger.error(
-                    f"could not read domains pronunciation file {domains_pron_str}! aborting"
-                )
-                exit(1)
-            for ea_line in lines:
-                fs = ea_line.index(" ")
-                d = ea_line[:fs]
-                p = ea_line[fs:].strip()
-                domains_pronunciations[d] = p
-        else:
-            logger.error(
-                f"domains pronunciation file {domains_pron_str} doesn't exist! aborting"
-            )
-            exit(1)
-    else:  # try for default file
-        if os.path.exists("domains_pronunciations.txt"):
-            with open("domains_pronunciations.txt") as f:
-                lines = f.read().splitlines()
-            for ea_line in lines:
-                fs = ea_line.index(" ")
-                d = ea_line[:fs]
-                p = ea_line[fs:].strip()
-                domains_pronunciations[d] = p
-        else:
-            logger.info(f"no domains pronunciation file specified and no default found")
-
-    # measure size of target dir, so we can measure the size of created mp3s
-    pre_size_in_bytes = 0
-    for f in os.scandir(output_dir):
-        pre_size_in_bytes += os.path.getsize(f)
-
-    # initialize other stats we'll track
-    mp3_count = 0
-    mp3_duration_in_s = 0.0
-    problem_count = 0
-
-    for cur_link_entry in link_entries:
-
-        # if mp3_count == 3:  # a rate limiter for during debugging
-        #     break
-
-        if cur_link_entry[0]:
-            row_id = int(cur_link_entry[0])
-        else:
-            row_id = 0
-
-        orig_url = cur_link_entry[1]
-        url = orig_url.lower()
-
-        date_emailed = cur_link_entry[2]
-        # date_loaded = cur_link_entry[3]  # this column is in my database, but it doesn't get used
-
-        domains = url_utils.get_domains(url)
-        if domains in domains_pronunciations:
-            domains_pron = domains_pronunciations[domains]
-        else:
-            domains_pron = tts.get_domains_pron(domains)
+    if not load_domains_pronunciations(domains_pron, write_index=not args.plan):
+        exit(1)
 
-        path = url_utils.get_path_of_url(url, domains)
-        path_as_tokens = url_utils.trim_path_tokens(text_utils.tokenize_string(path))
-        spoken_title = tts.get_spoken_title(domains, path_as_tokens)
+    if args.plan:
+        journal.open_read_only()
+        print_plan(link_entries, output_dir, args.force, args.from_cache)
+        return
 
-        if date_emailed:
-            saved_via_email_slug = (
-                f"It was saved via email on {my_time.pretty_date(date_emailed)}.\n\n"
-            )
-        else:
-            saved_via_email_slug = ""
+    # the database source claims rows as it goes, so its total isn't known up front
+    metrics.start_run(args.metrics_out, None if store else url_count)
 
-        intro_script = (
-            f"The next article is from {domains_pron}.\n\n"
-            f"Its title is {spoken_title}.\n\n"
-            f"{saved_via_email_slug}"
-            f"It was digitized to audio on {my_time.pretty_date(datetime.datetime.now())}.\n\n"
+    extract_executor = make_extract_executor(extract_workers, supervise=args.supervise)
+    tts_executor = None
+    if args.supervise:
+        tts_executor = make_tts_executor(tts_workers, supervise=True)
+    try:
+        stats = process_link_entries(
+            link_entries,
+            store,
+            output_dir,
+            fetch_concurrency,
+            tts_workers,
+            chunk_chars,
+            encode_workers,
+            args.from_cache,
+            args.force,
+            tts_executor=tts_executor,
+            extract_executor=extract_executor,
+            quick_wins=args.quick_wins,
         )
+    finally:
+        if tts_executor:
+            tts_executor.shutdown()
+        if extract_executor:
+            extract_executor.shutdown()
+    mp3_count = stats["mp3_count"]
+    mp3_duration_in_s = stats["mp3_duration_in_s"]
+    mp3_size_in_bytes = stats["mp3_size_in_bytes"]
+    problem_count = stats["problem_count"]
+    skipped_count = stats["skipped_count"]
+    duplicate_count = stats["duplicate_count"]
 
-        mp3_filename = f"{text_utils.get_base_filename(url)}.mp3"
+    metrics.finish_run()
 
-        story_content = get_content(orig_url)
+    if store:
+        stop_renewing.set()
+        store.flush_status_updates()
 
-        if not story_content:
-            error = f"error getting content from url {url}"
-            logger.error(error)
-            if source_str.lower() == "database":
-                db.mark_row_as_processing_error_in_db(
-                    row_id, "error getting content from url"
-                )
-            problem_count += 1
-            continue
-
-        mp3_full_path = os.path.join(output_dir, mp3_filename)
-
-        try:
-            tts.engine.save_to_file((intro_script + story_content), mp3_full_path)
-            tts.engine.runAndWait()
-        except Exception as e:
-            error = f"error while converting to mp3 file: {e}"
-            logger.error(error)
-            if source_str.lower() == "database":
-                db.mark_row_as_processing_error_in_db(error)
-            problem_count += 1
-            continue
-
-        # presumably success by this point
-        mp3_count += 1
-        mp3_duration_in_s += float(
-            ffmpeg.probe(os.path.join(output_dir, mp3_filename))["format"]["duration"]
-        )
-
-        if source_str.lower() == "database":
-            db.mark_row_as_processed_in_db(row_id)
+    evict_caches()
 
     # tally statistics
     end_ts = my_time.get_time_now_in_seconds()
     end_dt = my_time.get_cur_datetime()
     processing_duration_in_s = end_ts - start_ts
 
-    post_size_in_bytes = 0
-    for f in os.scandir(output_dir):
-        post_size_in_bytes += os.path.getsize(f)
-
-    size_delta_in_bytes = post_size_in_bytes - pre_size_in_bytes
-
     units = ["B", "KB", "MB", "GB"]
     unit_index = 0
 
-    # why might size delta not increase? if we fail on all URLs, or if created mp3s overwrite existing mp3s of same size
-    if size_delta_in_bytes > 0:
-        size_delta = size_delta_in_bytes
-        while size_delta > 1_000:
-            size_delta /= 1_000.0
+    # why might there be no bytes? if we fail on (or skip) all URLs
+    if mp3_size_in_bytes > 0:
+        mp3_size = mp3_size_in_bytes
+        while mp3_size > 1_000:
+            mp3_size /= 1_000.0
             unit_index += 1
-        mp3s_size_slug = f"{round(size_delta, 2)} {units[unit_index]}"
-        mp3s_dur_per_MB = f"{my_time.pretty_print_duration(mp3_duration_in_s / (size_delta_in_bytes / 1_000_000))}"
+        mp3s_size_slug = f"{round(mp3_size, 2)} {units[unit_index]}"
+        mp3s_dur_per_MB = f"{my_time.pretty_print_duration(mp3_duration_in_s / (mp3_size_in_bytes / 1_000_000))}"
     else:
-        mp3s_size_slug = "the number of bytes in target folder did not increase"
-        mp3s_dur_per_MB = "could not calculate since number of bytes did not increase"
+        mp3s_size_slug = "no mp3s were written"
+        mp3s_dur_per_MB = "could not calculate since no mp3s were written"
 
-    # TODO: provide a dynamic "time taken and time left" progress indicator
-    # TODO: if article isn't available, then try archive.is and Wayback Machine, check available snapshots starting with most recent
     # TODO: for domains not in a pronunciations file, check website and try to determine sayable name of website. check tags with keywords like title, by, byline, site, site_name, site-name, description, meta, etc. and compare strings with spaces to the closed-up strings in the domain name. e.g., avanwyk would be Andrich van Wyk
 
     print(
@@ -282,13 +1380,21 @@ if __name__ == "__main__":
         f"start time:    {start_dt}\n"
         f"end time:      {end_dt}\n"
         f"time taken:    {my_time.pretty_print_duration(processing_duration_in_s)}\n"
-        f"mp3s count:    {mp3_count - problem_count}\n"
+        f"mp3s count:    {mp3_count}\n"
         f"mp3s size:     {mp3s_size_slug}\n"
         f"mp3s duration: {my_time.pretty_print_duration(mp3_duration_in_s)}\n"
         f"mp3s dur/MB:   {mp3s_dur_per_MB}\n"
         f"problem URLs:  {problem_count}\n"
+        f"stage times:   {metrics.get_stage_summary()}\n"
+        f"skipped URLs:  {skipped_count} (finished in an earlier run)\n"
+        f"duplicates:    {duplicate_count} (same article as another URL)\n"
+        + (f"supervisor:    {supervisor.get_summary()}\n" if args.supervise else "")
     )
 
     logger.info(
-        f"source {source[0]}, start {start_dt}, end {end_dt}, taken {my_time.pretty_print_duration(processing_duration_in_s)}, mp3s_count {mp3_count - problem_count}, mp3s_size_slug {mp3s_size_slug}, mp3_duration_in_s {my_time.pretty_print_duration(mp3_duration_in_s)}, mp3s_dur_per_MB {mp3s_dur_per_MB}, problem_count {problem_count}"
+        f"source {source[0]}, start {start_dt}, end {end_dt}, taken {my_time.pretty_print_duration(processing_duration_in_s)}, mp3s_count {mp3_count}, mp3s_size_slug {mp3s_size_slug}, mp3_duration_in_s {my_time.pretty_print_duration(mp3_duration_in_s)}, mp3s_dur_per_MB {mp3s_dur_per_MB}, problem_count {problem_count}, skipped_count {skipped_count}, duplicate_count {duplicate_count}"
     )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+
+import config
+import url_utils
+
+logger = logging.getLogger(__name__)
+
+# each cached URL gets a directory CACHE_DIR/<first 2 hex digits>/<sha256 of the
+# normalized URL>/ holding the raw page, its validators and the extracted text
+# and metadata. the directory's mtime is bumped on every hit and serves as the
+# LRU clock
+
+RAW_FILENAME = "raw.html"
+META_FILENAME = "meta.json"
+EXTRACTED_FILENAME = "extracted.txt"
+ARTICLE_FILENAME = "article.json"  # title, site name, author and date
+
+
+def get_cache_key(url):
+    return hashlib.sha256(url_utils.normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def get_entry_dir(url):
+    key = get_cache_key(url)
+    return os.path.join(config.settings["CACHE_DIR"], key[:2], key)
+
+
+def write_file_atomically(full_path, data):
+    # fetcher threads may race on the same URL, so never expose a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, full_path)
+
+
+def load_entry(url):
+    # returns {"url", "etag", "last_modified", "fetched_at", "html", "extracted"}
+    # or None. "extracted" is the article as extractor.extract_article returned
+    # it (any metadata field may be missing), or None if the page was never
+    # successfully extracted
+    entry_dir = get_entry_dir(url)
+    try:
+        with open(os.path.join(entry_dir, META_FILENAME), "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        with open(os.path.join(entry_dir, RAW_FILENAME), "rb") as f:
+            entry["html"] = f.read()
+    except (OSError, ValueError):
+        return None
+
+    try:
+        with open(
+            os.path.join(entry_dir, EXTRACTED_FILENAME), "r", encoding="utf-8"
+        ) as f:
+            entry["extracted"] = {"text": f.read()}
+    except OSError:
+        entry["extracted"] = None
+    else:
+        try:
+            with open(
+                os.path.join(entry_dir, ARTICLE_FILENAME), "r", encoding="utf-8"
+            ) as f:
+                entry["extracted"].update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    touch_entry(url)
+    return entry
+
+
+def touch_entry(url):
+    try:
+        os.utime(get_entry_dir(url))
+    except OSError:
+        pass
+
+
+def store_page(url, html, etag, last_modified):
+    entry_dir = get_entry_dir(url)
+    os.makedirs(entry_dir, exist_ok=True)
+    meta = {
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": int(time.time()),
+    }
+    write_file_atomically(os.path.join(entry_dir, RAW_FILENAME), html)
+    write_file_atomically(
+        os.path.join(entry_dir, META_FILENAME), json.dumps(meta).encode("utf-8")
+    )
+    # a new page invalidates whatever was extracted from the old one
+    for each_filename in (EXTRACTED_FILENAME, ARTICLE_FILENAME):
+        try:
+            os.remove(os.path.join(entry_dir, each_filename))
+        except OSError:
+            pass
+
+
+def store_extracted(url, article):
+    entry_dir = get_entry_dir(url)
+    if os.path.isdir(entry_dir):
+        metadata = {name: value for name, value in article.items() if name != "text"}
+        write_file_atomically(
+            os.path.join(entry_dir, ARTICLE_FILENAME),
+            json.dumps(metadata).encode("utf-8"),
+        )
+        write_file_atomically(
+            os.path.join(entry_dir, EXTRACTED_FILENAME),
+            article["text"].encode("utf-8"),
+        )
+
+
+def evict_lru(cache_dir, max_bytes):
+    # delete least recently used entries until the cache fits into max_bytes
+    if not os.path.isdir(pathlib.Path(cache_dir)):
+        return
+
+    entries = []
+    total_bytes = 0
+    for shard in os.scandir(cache_dir):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if not entry.is_dir():
+                continue
+            entry_bytes = sum(f.stat().st_size for f in os.scandir(entry.path))
+            entries.append((entry.stat().st_mtime, entry_bytes, entry.path))
+            total_bytes += entry_bytes
+
+    entries.sort()
+    evicted_count = 0
+    for _, entry_bytes, entry_path in entries:
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        total_bytes -= entry_bytes
+        evicted_count += 1
+
+    if evicted_count:
+        logger.info(f"evicted {evicted_count} entries from {cache_dir}")
@@ -1,17 +1,38 @@
 import pathlib
-import yaml
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
-with open("settings.yaml", "r", encoding="utf-8") as f:
-    settings = yaml.safe_load(f)
+# settings.yaml is read on first access to config.settings rather than at import,
+# so that importing benson's modules stays cheap
 
-# check for required directories
-required_directories = []
-required_directories.append(settings["OUTPUT_DIR_MP3_FILES"])
-for each_dir in required_directories:
-    if not os.path.isdir(pathlib.Path(each_dir)):
-        os.makedirs(pathlib.Path(each_dir))
-        logger.warning(f"{each_dir} had to be created")
+
+def load_settings():
+    import yaml
+
+    with open("settings.yaml", "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def get_settings():
+    if "settings" not in globals():
+        # once it's a module global, config.settings no longer goes through __getattr__
+        globals()["settings"] = load_settings()
+    return globals()["settings"]
+
+
+def __getattr__(name):
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def ensure_required_directories():
+    # check for required directories
+    required_directories = []
+    required_directories.append(get_settings()["OUTPUT_DIR_MP3_FILES"])
+    for each_dir in required_directories:
+        if not os.path.isdir(pathlib.Path(each_dir)):
+            os.makedirs(pathlib.Path(each_dir))
+            logger.warning(f"{each_dir} had to be created")
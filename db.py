@@ -1,60 +1,224 @@
-import mysql.connector
-import yaml
+import atexit
+import logging
+import threading
+import time
 
+import config
 import my_time
 
-with open("secrets.yaml", "r", encoding="utf-8") as f:
-    secrets = yaml.safe_load(f)
+logger = logging.getLogger(__name__)
+
+# secrets.yaml and the mysql driver are only loaded once a connection is needed,
+# so runs that don't use the database work without either
+secrets = None
+
+# several benson workers can drain the urls table at once: each one claims a batch
+# of rows by writing its worker id and a lease expiry into them, keeps renewing
+# the lease while it works, and rows whose lease ran out can be claimed again.
+# this needs two more columns on the urls table (and MySQL 8 for SKIP LOCKED):
+#   ALTER TABLE urls ADD COLUMN lease_owner VARCHAR(255) NULL,
+#                    ADD COLUMN lease_expires DATETIME NULL;
+
+SELECT_CLAIMABLE_SQL = (
+    "SELECT id, url, date_emailed, date_loaded FROM urls"
+    " WHERE date_egressed IS NULL AND egress_note IS NULL"
+    " AND (lease_expires IS NULL OR lease_expires < UTC_TIMESTAMP())"
+    " ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED;"
+)
+SELECT_PAGE_SQL = (
+    "SELECT id, url, date_emailed, date_loaded FROM urls"
+    " WHERE date_egressed IS NULL AND egress_note IS NULL AND id > %s"
+    " ORDER BY id LIMIT %s;"
+)
+RENEW_LEASES_SQL = (
+    "UPDATE urls SET lease_expires = UTC_TIMESTAMP() + INTERVAL %s SECOND"
+    " WHERE lease_owner = %s AND date_egressed IS NULL AND egress_note IS NULL;"
+)
+RELEASE_LEASES_SQL = (
+    "UPDATE urls SET lease_owner = NULL, lease_expires = NULL"
+    " WHERE lease_owner = %s AND date_egressed IS NULL AND egress_note IS NULL;"
+)
+MARK_PROCESSED_SQL = "UPDATE urls SET date_egressed = %s WHERE id = %s;"
+MARK_ERROR_SQL = "UPDATE urls SET egress_note = %s WHERE id = %s;"
+
+# connections are handed out by a pool that is created on first use;
+# calling close() on a pooled connection returns it to the pool
+pool = None
+pool_lock = threading.Lock()
+POOL_RETRY_S = 0.05
+
+# status updates are buffered and written in batches by flush_status_updates(),
+# which runs when the buffer is full, every DB_FLUSH_INTERVAL_S seconds, and at exit.
+# the first and second of those run in different threads, and take their
+# connection from the same pool as claiming rows and renewing leases (see
+# DB_POOL_SIZE). a batch that can't be written stays buffered for the next flush
+pending_updates = []
+pending_lock = threading.Lock()
+flush_lock = threading.Lock()
+flusher_thread = None
+
+
+def get_secrets():
+    global secrets
+    if secrets is None:
+        import yaml
+
+        with open("secrets.yaml", "r", encoding="utf-8") as f:
+            secrets = yaml.safe_load(f)
+    return secrets
+
+
+def get_connection():
+    # the pool doesn't wait for a connection to be returned to it: it raises
+    # PoolError right away when they're all in use. so wait here, for up to
+    # DB_POOL_WAIT_S
+    global pool
+    import mysql.connector.pooling
+
+    with pool_lock:
+        if pool is None:
+            secrets = get_secrets()
+            pool = mysql.connector.pooling.MySQLConnectionPool(
+                pool_name="benson",
+                pool_size=config.settings["DB_POOL_SIZE"],
+                host=secrets["MYSQL"]["HOST"],
+                database=secrets["MYSQL"]["DATABASE"],
+                user=secrets["MYSQL"]["USER"],
+                password=secrets["MYSQL"]["PASSWORD"],
+            )
+    deadline = time.monotonic() + config.settings["DB_POOL_WAIT_S"]
+    while True:
+        try:
+            return pool.get_connection()
+        except mysql.connector.errors.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(POOL_RETRY_S)
 
 
 def get_urls_from_db():
-    con = mysql.connector.connect(
-        host=secrets["MYSQL"]["HOST"],
-        database=secrets["MYSQL"]["DATABASE"],
-        user=secrets["MYSQL"]["USER"],
-        password=secrets["MYSQL"]["PASSWORD"],
-    )
-    cur = con.cursor()
-    cur.execute(
-        "SELECT * FROM urls WHERE date_egressed IS NULL AND egress_note IS NULL;"
-    )
-    link_entries = cur.fetchall()
-    cur.close()
-    con.close()
+    # pages through the unprocessed rows by id, so that neither the database nor
+    # this process ever holds the whole backlog at once
+    page_size = config.settings["SOURCE_PAGE_SIZE"]
+    last_id = 0
+    while True:
+        con = get_connection()
+        cur = con.cursor()
+        cur.execute(SELECT_PAGE_SQL, (last_id, page_size))
+        link_entries = cur.fetchall()
+        cur.close()
+        con.close()
+
+        yield from link_entries
+        if len(link_entries) < page_size:
+            return
+        last_id = link_entries[-1][0]
+
+
+def claim_urls(worker_id, batch_size, lease_s):
+    # atomically reserve up to batch_size unprocessed rows that nobody else holds
+    con = get_connection()
+    try:
+        con.start_transaction()
+        cur = con.cursor()
+        cur.execute(SELECT_CLAIMABLE_SQL, (batch_size,))
+        link_entries = cur.fetchall()
+        if link_entries:
+            row_ids = [each_entry[0] for each_entry in link_entries]
+            placeholders = ", ".join(["%s"] * len(row_ids))
+            cur.execute(
+                "UPDATE urls SET lease_owner = %s,"
+                " lease_expires = UTC_TIMESTAMP() + INTERVAL %s SECOND"
+                f" WHERE id IN ({placeholders});",
+                (worker_id, lease_s, *row_ids),
+            )
+        con.commit()
+        cur.close()
+    except Exception:
+        con.rollback()
+        raise
+    finally:
+        con.close()
 
     return link_entries
 
 
-def mark_row_as_processed_in_db(row_id: int):
-    con = mysql.connector.connect(
-        host=secrets["MYSQL"]["HOST"],
-        database=secrets["MYSQL"]["DATABASE"],
-        user=secrets["MYSQL"]["USER"],
-        password=secrets["MYSQL"]["PASSWORD"],
-    )
-    cur = con.cursor()
+def renew_leases(worker_id, lease_s):
+    con = get_connection()
+    try:
+        cur = con.cursor()
+        cur.execute(RENEW_LEASES_SQL, (lease_s, worker_id))
+        con.commit()
+        cur.close()
+    finally:
+        con.close()
 
-    date_egressed = my_time.get_sql_timestamp_now()
-    cur.execute(
-        f"UPDATE urls SET date_egressed = '{date_egressed}' WHERE id = {row_id};"
-    )
-    con.commit()
 
-    cur.close()
-    con.close()
+def release_leases(worker_id):
+    # give up the rows this worker claimed but didn't finish. the buffered status
+    # updates go first, or finished rows would look unfinished
+    flush_status_updates()
+    con = get_connection()
+    try:
+        cur = con.cursor()
+        cur.execute(RELEASE_LEASES_SQL, (worker_id,))
+        con.commit()
+        cur.close()
+    finally:
+        con.close()
+
+
+def mark_row_as_processed_in_db(row_id: int):
+    date_egressed = my_time.get_sql_timestamp_now()
+    queue_status_update(MARK_PROCESSED_SQL, (date_egressed, row_id))
 
 
 def mark_row_as_processing_error_in_db(row_id: int, error_msg: str):
-    con = mysql.connector.connect(
-        host=secrets["MYSQL"]["HOST"],
-        database=secrets["MYSQL"]["DATABASE"],
-        user=secrets["MYSQL"]["USER"],
-        password=secrets["MYSQL"]["PASSWORD"],
-    )
-    cur = con.cursor()
-
-    cur.execute(f"UPDATE urls SET egress_note = '{error_msg}' WHERE id = {row_id};")
-    con.commit()
-
-    cur.close()
-    con.close()
+    queue_status_update(MARK_ERROR_SQL, (error_msg, row_id))
+
+
+def queue_status_update(sql, params):
+    global flusher_thread
+    with pending_lock:
+        pending_updates.append((sql, params))
+        buffer_is_full = len(pending_updates) >= config.settings["DB_FLUSH_BATCH_SIZE"]
+        if flusher_thread is None:
+            flusher_thread = threading.Thread(target=flush_periodically, daemon=True)
+            flusher_thread.start()
+            atexit.register(flush_status_updates)
+    if buffer_is_full:
+        flush_status_updates()
+
+
+def flush_periodically():
+    while True:
+        time.sleep(config.settings["DB_FLUSH_INTERVAL_S"])
+        flush_status_updates()
+
+
+def flush_status_updates():
+    with flush_lock:
+        with pending_lock:
+            batch = pending_updates[:]
+            pending_updates.clear()
+        if not batch:
+            return
+
+        params_by_sql = {}
+        for sql, params in batch:
+            params_by_sql.setdefault(sql, []).append(params)
+
+        try:
+            con = get_connection()
+            try:
+                cur = con.cursor()
+                for sql, seq_of_params in params_by_sql.items():
+                    cur.executemany(sql, seq_of_params)
+                con.commit()
+                cur.close()
+            finally:
+                con.close()
+        except Exception as e:
+            logger.error(f"error while writing {len(batch)} status updates to db: {e}")
+            with pending_lock:  # keep them for the next attempt
+                pending_updates[:0] = batch
@@ -0,0 +1,138 @@
+import datetime
+import sqlite3
+import threading
+
+import config
+import my_time
+
+# a local stand-in for the MySQL backend in db.py with the same functions, so
+# the claim/lease protocol can be exercised without a database server. times
+# are stored as "YYYY-MM-DD HH:MM:SS" UTC strings, which sort chronologically
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    date_emailed TEXT,
+    date_loaded TEXT,
+    date_egressed TEXT,
+    egress_note TEXT,
+    lease_owner TEXT,
+    lease_expires TEXT
+);
+"""
+
+con = None
+con_lock = threading.Lock()
+
+
+def get_connection():
+    # one connection shared by all threads; every use holds con_lock
+    global con
+    if con is None:
+        con = sqlite3.connect(
+            config.settings["SQLITE_DB_PATH"],
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        con.execute(CREATE_TABLE_SQL)
+    return con
+
+
+def get_sql_timestamp_in(num_seconds):
+    dt = datetime.datetime.utcnow() + datetime.timedelta(seconds=num_seconds)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def add_urls(urls):
+    with con_lock:
+        get_connection().executemany(
+            "INSERT INTO urls (url, date_loaded) VALUES (?, ?);",
+            [(each_url, my_time.get_sql_timestamp_now()) for each_url in urls],
+        )
+
+
+def get_urls_from_db():
+    # paged like db.get_urls_from_db, and without holding con_lock in between
+    page_size = config.settings["SOURCE_PAGE_SIZE"]
+    last_id = 0
+    while True:
+        with con_lock:
+            link_entries = (
+                get_connection()
+                .execute(
+                    "SELECT id, url, date_emailed, date_loaded FROM urls"
+                    " WHERE date_egressed IS NULL AND egress_note IS NULL"
+                    " AND id > ? ORDER BY id LIMIT ?;",
+                    (last_id, page_size),
+                )
+                .fetchall()
+            )
+        yield from link_entries
+        if len(link_entries) < page_size:
+            return
+        last_id = link_entries[-1][0]
+
+
+def claim_urls(worker_id, batch_size, lease_s):
+    with con_lock:
+        cur = get_connection()
+        cur.execute("BEGIN IMMEDIATE;")  # takes the write lock across processes
+        try:
+            link_entries = cur.execute(
+                "SELECT id, url, date_emailed, date_loaded FROM urls"
+                " WHERE date_egressed IS NULL AND egress_note IS NULL"
+                " AND (lease_expires IS NULL OR lease_expires < ?)"
+                " ORDER BY id LIMIT ?;",
+                (my_time.get_sql_timestamp_now(), batch_size),
+            ).fetchall()
+            cur.executemany(
+                "UPDATE urls SET lease_owner = ?, lease_expires = ? WHERE id = ?;",
+                [
+                    (worker_id, get_sql_timestamp_in(lease_s), each_entry[0])
+                    for each_entry in link_entries
+                ],
+            )
+            cur.execute("COMMIT;")
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+    return link_entries
+
+
+def renew_leases(worker_id, lease_s):
+    with con_lock:
+        get_connection().execute(
+            "UPDATE urls SET lease_expires = ?"
+            " WHERE lease_owner = ? AND date_egressed IS NULL AND egress_note IS NULL;",
+            (get_sql_timestamp_in(lease_s), worker_id),
+        )
+
+
+def release_leases(worker_id):
+    # give up the rows this worker claimed but didn't finish
+    with con_lock:
+        get_connection().execute(
+            "UPDATE urls SET lease_owner = NULL, lease_expires = NULL"
+            " WHERE lease_owner = ? AND date_egressed IS NULL AND egress_note IS NULL;",
+            (worker_id,),
+        )
+
+
+def mark_row_as_processed_in_db(row_id: int):
+    with con_lock:
+        get_connection().execute(
+            "UPDATE urls SET date_egressed = ? WHERE id = ?;",
+            (my_time.get_sql_timestamp_now(), row_id),
+        )
+
+
+def mark_row_as_processing_error_in_db(row_id: int, error_msg: str):
+    with con_lock:
+        get_connection().execute(
+            "UPDATE urls SET egress_note = ? WHERE id = ?;", (error_msg, row_id)
+        )
+
+
+def flush_status_updates():
+    pass  # writes are local and immediate
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import tempfile
+import wave
+
+import config
+
+# the last stage before an mp3 lands in the output directory: the audio parts a
+# job was synthesized into (wav files, in order) are streamed as raw PCM into one
+# ffmpeg process that encodes them with ENCODE_CODEC at ENCODE_BITRATE and writes
+# the ID3 tags. parts that aren't wav (other tts engines write other formats)
+# go through ffmpeg's concat demuxer instead
+
+PCM_FORMATS = {1: "u8", 2: "s16le", 4: "s32le"}  # by wav sample width
+PCM_READ_FRAMES = 1 << 16
+
+
+def get_wav_params(input_paths):
+    # returns the params shared by every part, or None if any part isn't a wav
+    # or the parts don't match
+    all_params = []
+    for each_path in input_paths:
+        try:
+            with wave.open(each_path, "rb") as f:
+                all_params.append(f.getparams())
+        except (wave.Error, EOFError):
+            return None
+    if len({params[:3] for params in all_params}) != 1:  # channels, width, rate
+        return None
+    if all_params[0].sampwidth not in PCM_FORMATS:
+        return None
+    return all_params[0]
+
+
+def get_output_args(tags):
+    output_args = {
+        "format": "mp3",
+        "acodec": config.settings["ENCODE_CODEC"],
+        "audio_bitrate": config.settings["ENCODE_BITRATE"],
+        "id3v2_version": 3,
+    }
+    # ffmpeg-python turns each of these into a separate -metadata option
+    for i, (name, value) in enumerate(tags.items()):
+        if value:
+            output_args[f"metadata:g:{i}"] = f"{name}={value}"
+    return output_args
+
+
+def encode_to_mp3(input_paths, output_path, tags):
+    # tags: ID3 fields by ffmpeg's names, e.g. {"title": ..., "artist": ...}.
+    # the mp3 only appears at output_path once it's complete
+    import ffmpeg
+
+    tmp_path = f"{output_path}.tmp"
+    wav_params = get_wav_params(input_paths)
+    if wav_params:
+        stream = ffmpeg.input(
+            "pipe:",
+            format=PCM_FORMATS[wav_params.sampwidth],
+            ar=wav_params.framerate,
+            ac=wav_params.nchannels,
+        )
+        list_path = None
+    else:
+        list_fd, list_path = tempfile.mkstemp(prefix="benson-", suffix=".txt")
+        with os.fdopen(list_fd, "w", encoding="utf-8") as f:
+            for each_path in input_paths:
+                escaped_path = os.path.abspath(each_path).replace("'", "'\\''")
+                f.write(f"file '{escaped_path}'\n")
+        stream = ffmpeg.input(list_path, format="concat", safe=0)
+
+    args = (
+        stream.output(tmp_path, **get_output_args(tags))
+        .global_args("-loglevel", "error")
+        .overwrite_output()
+        .compile()
+    )
+    try:
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE if wav_params else subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=stderr_file,
+                start_new_session=True,  # ctrl-c is for benson, see benson.serve()
+            )
+            if wav_params:
+                try:
+                    for each_path in input_paths:
+                        with wave.open(each_path, "rb") as f:
+                            while frames := f.readframes(PCM_READ_FRAMES):
+                                process.stdin.write(frames)
+                except BrokenPipeError:
+                    pass  # ffmpeg quit early; its exit code and stderr say why
+                finally:
+                    process.stdin.close()
+            if process.wait() != 0:
+                stderr_file.seek(0)
+                stderr_text = stderr_file.read().decode("utf-8", errors="replace")
+                raise RuntimeError(f"ffmpeg failed: {stderr_text.strip()}")
+        os.replace(tmp_path, output_path)
+    finally:
+        if list_path:
+            os.remove(list_path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,29 @@
+import signal
+
+# content extraction, which is CPU-bound lxml work that holds the GIL. it runs in
+# worker processes so that it doesn't stall the fetcher threads, synthesis or
+# encoding. the raw html goes to the workers as bytes, which pickle as a single
+# copy; trafilatura works out the encoding itself. the page's metadata comes out
+# of the same parse as the text
+
+ARTICLE_FIELDS = ("text", "title", "sitename", "author", "date")
+
+
+def start_worker(ignore_stop_signals=False):  # runs in each extract worker process
+    import trafilatura  # slow to import, so do it before the first page arrives
+
+    if ignore_stop_signals:  # see benson.serve()
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def extract_article(html):
+    # returns {"text", "title", "sitename", "author", "date"}, with None for the
+    # metadata the page doesn't give (date is YYYY-MM-DD), or None if there's
+    # no text
+    import trafilatura
+
+    document = trafilatura.bare_extraction(html, include_comments=False)
+    if not document or not document.get("text"):
+        return None
+    return {name: document.get(name) for name in ARTICLE_FIELDS}
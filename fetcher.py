@@ -0,0 +1,225 @@
+import concurrent.futures
+import email.utils
+import threading
+import time
+
+import config
+import url_utils
+
+# one pool manager for the whole process; it's thread-safe and keeps up to
+# FETCH_MAX_PER_DOMAIN connections to each host alive between requests
+http = None
+http_lock = threading.Lock()
+
+# politeness bookkeeping per domain (as grouped by url_utils.get_domains): a cap
+# on requests in flight, and the earliest time we may ask that domain again
+# after it told us to back off with a 429 or 503
+domain_slots = {}
+domain_not_before = {}
+domains_lock = threading.Lock()
+
+BACKOFF_STATUSES = (429, 503)
+
+
+def get_pool_manager():
+    global http
+    with http_lock:
+        if http is None:
+            import urllib3
+
+            http = urllib3.PoolManager(
+                num_pools=100,
+                maxsize=config.settings["FETCH_MAX_PER_DOMAIN"],
+                headers={"User-Agent": config.settings["FETCH_USER_AGENT"]},
+                timeout=urllib3.Timeout(total=config.settings["FETCH_TIMEOUT_S"]),
+                retries=urllib3.Retry(
+                    total=2,
+                    redirect=5,
+                    raise_on_status=False,
+                    respect_retry_after_header=False,  # handled per domain below
+                ),
+            )
+    return http
+
+
+def get_domain_slot(domains):
+    with domains_lock:
+        if domains not in domain_slots:
+            domain_slots[domains] = threading.BoundedSemaphore(
+                config.settings["FETCH_MAX_PER_DOMAIN"]
+            )
+        return domain_slots[domains]
+
+
+def wait_for_domain(domains):
+    while True:
+        with domains_lock:
+            delay_s = domain_not_before.get(domains, 0) - time.monotonic()
+        if delay_s <= 0:
+            return
+        time.sleep(delay_s)
+
+
+def back_off_domain(domains, delay_s):
+    with domains_lock:
+        domain_not_before[domains] = max(
+            domain_not_before.get(domains, 0), time.monotonic() + delay_s
+        )
+
+
+def get_retry_after_s(headers, attempt):
+    # honor a Retry-After header (in seconds or as an http date), otherwise
+    # back off exponentially
+    retry_after = headers.get("Retry-After")
+    delay_s = 2**attempt
+    if retry_after:
+        if retry_after.strip().isdigit():
+            delay_s = int(retry_after)
+        else:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                delay_s = retry_at.timestamp() - time.time()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay_s, 0), config.settings["FETCH_MAX_BACKOFF_S"])
+
+
+def fetch_url(url, etag=None, last_modified=None):
+    # returns (status, body as bytes, response headers). passing the validators
+    # of a cached copy turns this into a conditional GET that may return 304
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    domains = url_utils.get_domains(url.lower())
+    max_retries = config.settings["FETCH_MAX_RETRIES"]
+    with get_domain_slot(domains):
+        for attempt in range(max_retries + 1):
+            wait_for_domain(domains)
+            response = get_pool_manager().request("GET", url, headers=headers)
+            if response.status not in BACKOFF_STATUSES or attempt == max_retries:
+                break
+            back_off_domain(domains, get_retry_after_s(response.headers, attempt))
+
+    return response.status, response.data, response.headers
+
+
+# when an origin is slow or dead, and ARCHIVE_URL_TEMPLATES is set up (it's
+# empty by default), race the origin against archived copies of the page:
+# after HEDGE_DELAY_S (or at once, if the origin has already failed) the same
+# URL is requested from every ARCHIVE_URL_TEMPLATES endpoint, and whichever
+# usable response comes first wins. a domain whose origin failed
+# CIRCUIT_BREAKER_FAILURES times in a row isn't asked again for
+# CIRCUIT_BREAKER_RESET_S; its URLs go straight to the archives
+domain_failures = {}  # consecutive failures, and when the last one happened
+breaker_lock = threading.Lock()
+
+
+def is_circuit_open(domains):
+    with breaker_lock:
+        failure_count, last_failure_ts = domain_failures.get(domains, (0, 0))
+    if failure_count < config.settings["CIRCUIT_BREAKER_FAILURES"]:
+        return False
+    reset_s = config.settings["CIRCUIT_BREAKER_RESET_S"]
+    return time.monotonic() - last_failure_ts < reset_s
+
+
+def record_origin_result(domains, healthy):
+    with breaker_lock:
+        if healthy:
+            domain_failures.pop(domains, None)
+        else:
+            failure_count = domain_failures.get(domains, (0, 0))[0]
+            domain_failures[domains] = (failure_count + 1, time.monotonic())
+
+
+def is_usable(status, data):
+    return status == 304 or (status == 200 and bool(data))
+
+
+def fetch_origin(url, etag, last_modified):
+    domains = url_utils.get_domains(url.lower())
+    try:
+        status, data, headers = fetch_url(url, etag, last_modified)
+    except Exception:
+        record_origin_result(domains, False)
+        raise
+    # a 404 says nothing about the host's health; timeouts and 5xx do
+    record_origin_result(domains, status < 500 and status != 429)
+    return status, data, headers
+
+
+def fetch_archived(url, archive_url_template):
+    archive_url = archive_url_template.format(url=url)
+    status, data, headers = fetch_url(archive_url)
+    if status == 304:  # we sent no validators, so this isn't our 304 to keep
+        status = 0
+    return status, data, headers
+
+
+def start_in_thread(func, *args):
+    # like executor.submit(), but on a daemon thread, so that a request that lost
+    # the race never holds up the end of the run while it times out
+    future = concurrent.futures.Future()
+
+    def run():
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def fetch_hedged(url, etag=None, last_modified=None):
+    # returns (status, body, headers, source), where source is "origin" or the
+    # archive template that answered. raises the origin's exception if nothing
+    # usable came back and the origin raised
+    archive_url_templates = config.settings["ARCHIVE_URL_TEMPLATES"] or []
+    if not archive_url_templates:  # hedging is off; the origin is all there is
+        return fetch_url(url, etag, last_modified) + ("origin",)
+    domains = url_utils.get_domains(url.lower())
+    circuit_open = is_circuit_open(domains)
+
+    # losing requests aren't cancelled; they finish in the background
+    sources = {}
+    origin_future = None
+    if not circuit_open:
+        origin_future = start_in_thread(fetch_origin, url, etag, last_modified)
+        sources[origin_future] = "origin"
+        done, _ = concurrent.futures.wait(
+            [origin_future], timeout=config.settings["HEDGE_DELAY_S"]
+        )
+        if done and origin_future.exception() is None:
+            status, data, headers = origin_future.result()
+            if is_usable(status, data):
+                return status, data, headers, "origin"
+
+    for archive_url_template in archive_url_templates:
+        future = start_in_thread(fetch_archived, url, archive_url_template)
+        sources[future] = archive_url_template
+
+    origin_error = None
+    last_result = None
+    for future in concurrent.futures.as_completed(sources):
+        try:
+            status, data, headers = future.result()
+        except Exception as e:
+            if sources[future] == "origin":
+                origin_error = e
+            continue
+        if is_usable(status, data):
+            if origin_future and not origin_future.done():
+                # too slow counts against the origin, too
+                record_origin_result(domains, False)
+            return status, data, headers, sources[future]
+        if sources[future] == "origin" or last_result is None:
+            last_result = (status, data, headers, sources[future])
+    if last_result:
+        return last_result
+    if origin_error:
+        raise origin_error
+    raise RuntimeError(f"no archive has a copy of {url}")
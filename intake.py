@@ -0,0 +1,87 @@
+import http.server
+import json
+import logging
+import os
+import threading
+
+import db_sqlite
+
+logger = logging.getLogger(__name__)
+
+# how URLs reach `benson.py serve`: every submission lands in the local SQLite
+# queue (db_sqlite), and work_available wakes the serve loop so it doesn't have
+# to wait out its poll interval. submissions come either as files dropped into
+# the spool directory (one URL per line, named *.txt; write them under another
+# name and rename, so a half-written file is never read; a file that can't be
+# read as UTF-8 text is moved to spool/failed) or as a POST to
+# http://127.0.0.1:<port>/urls with one URL per line in the body
+
+MAX_POST_BYTES = 1_000_000
+
+work_available = threading.Event()
+
+
+def read_urls(text):
+    return [each_line.strip() for each_line in text.splitlines() if each_line.strip()]
+
+
+def ingest_spool(spool_dir):
+    # queue the URLs of every spool file, then move the file to spool_dir/done,
+    # or to spool_dir/failed if it can't be read. returns how many URLs were
+    # queued
+    done_dir = os.path.join(spool_dir, "done")
+    failed_dir = os.path.join(spool_dir, "failed")
+    os.makedirs(done_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+    spool_files = sorted(
+        (f for f in os.scandir(spool_dir) if f.is_file() and f.name.endswith(".txt")),
+        key=lambda f: f.stat().st_mtime,
+    )
+    url_count = 0
+    for spool_file in spool_files:
+        try:
+            with open(spool_file.path, "r", encoding="utf-8") as f:
+                urls = read_urls(f.read())
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"could not read spool file {spool_file.name}, moved it to failed")
+            logger.error(f"error while reading spool file {spool_file.path}: {e}")
+            os.replace(spool_file.path, os.path.join(failed_dir, spool_file.name))
+            continue
+        db_sqlite.add_urls(urls)
+        os.replace(spool_file.path, os.path.join(done_dir, spool_file.name))
+        url_count += len(urls)
+    return url_count
+
+
+class SubmissionHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != "/urls":
+            self.send_json(404, {"error": "POST URLs to /urls"})
+            return
+        content_length = int(self.headers.get("Content-Length") or 0)
+        if content_length > MAX_POST_BYTES:
+            self.send_json(413, {"error": f"at most {MAX_POST_BYTES} bytes"})
+            return
+        body = self.rfile.read(content_length).decode("utf-8", errors="replace")
+        urls = read_urls(body)
+        db_sqlite.add_urls(urls)
+        work_available.set()
+        self.send_json(202, {"queued": len(urls)})
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # every submission shows up in the serve loop's output anyway
+
+
+def start_http_server(port):
+    # localhost only: there is no authentication
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), SubmissionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,143 @@
+import os
+import pathlib
+import sqlite3
+import threading
+
+import config
+import my_time
+
+# a local record of how far each URL got, keyed by text_utils.get_base_filename(),
+# so that a rerun after a crash can skip finished work and resume partial work.
+# stages, in order: "fetched", "extracted", "synthesized", "probed".
+# it also remembers which URLs a page named as its rel=canonical, and a hash of
+# every article's extracted text, so that duplicates are recognized
+
+CREATE_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS stages (
+    base_filename TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    completed_at TEXT NOT NULL,
+    detail TEXT,
+    PRIMARY KEY (base_filename, stage)
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    url TEXT PRIMARY KEY,
+    canonical_url TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_canonical_url ON aliases (canonical_url);
+CREATE TABLE IF NOT EXISTS contents (
+    content_hash TEXT PRIMARY KEY,
+    base_filename TEXT NOT NULL,
+    url TEXT NOT NULL
+);
+"""
+
+con = None
+con_lock = threading.Lock()
+read_only = False  # see open_read_only()
+
+
+def open_read_only():
+    # for --plan: the journal is only looked at, and not created if it isn't
+    # there yet (an empty one in memory stands in for it)
+    global read_only
+    read_only = True
+
+
+def get_connection():
+    # one connection shared by the main thread and the fetcher threads; every
+    # use holds con_lock
+    global con
+    if con is None:
+        journal_path = config.settings["JOURNAL_PATH"]
+        if read_only and os.path.exists(journal_path):
+            con = sqlite3.connect(
+                f"{pathlib.Path(journal_path).resolve().as_uri()}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+            return con
+        con = sqlite3.connect(
+            ":memory:" if read_only else journal_path,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        con.executescript(CREATE_TABLE_SQL)
+    return con
+
+
+def get_completed_stages(base_filename):
+    # returns {stage: detail} for every stage this URL has completed
+    with con_lock:
+        rows = (
+            get_connection()
+            .execute(
+                "SELECT stage, detail FROM stages WHERE base_filename = ?;",
+                (base_filename,),
+            )
+            .fetchall()
+        )
+    return dict(rows)
+
+
+def record_stage(base_filename, stage, detail=None):
+    with con_lock:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?);",
+            (base_filename, stage, my_time.get_sql_timestamp_now(), detail),
+        )
+
+
+def get_canonical_url(url):
+    # the rel=canonical recorded for url, if any, else url itself
+    with con_lock:
+        row = (
+            get_connection()
+            .execute("SELECT canonical_url FROM aliases WHERE url = ?;", (url,))
+            .fetchone()
+        )
+    return row[0] if row else url
+
+
+def get_aliases(canonical_url):
+    # the URLs whose pages named canonical_url as their rel=canonical
+    with con_lock:
+        rows = (
+            get_connection()
+            .execute(
+                "SELECT url FROM aliases WHERE canonical_url = ?;", (canonical_url,)
+            )
+            .fetchall()
+        )
+    return [row[0] for row in rows]
+
+
+def record_canonical_url(url, canonical_url):
+    with con_lock:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO aliases VALUES (?, ?);", (url, canonical_url)
+        )
+
+
+def claim_content(content_hash, base_filename, url):
+    # returns (base_filename, url) of the article that first had this text, which
+    # is the caller's own if nobody had it before
+    with con_lock:
+        cur = get_connection()
+        cur.execute(
+            "INSERT OR IGNORE INTO contents VALUES (?, ?, ?);",
+            (content_hash, base_filename, url),
+        )
+        return cur.execute(
+            "SELECT base_filename, url FROM contents WHERE content_hash = ?;",
+            (content_hash,),
+        ).fetchone()
+
+
+def release_content(content_hash, base_filename):
+    # when the article that claimed the text didn't make it after all
+    with con_lock:
+        get_connection().execute(
+            "DELETE FROM contents WHERE content_hash = ? AND base_filename = ?;",
+            (content_hash, base_filename),
+        )
@@ -0,0 +1,190 @@
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+import my_time
+
+# per-URL, per-stage timing for a run. every span goes to an optional JSONL trace
+# as it happens and into running totals, which feed the Prometheus textfile, the
+# live progress line and the stage breakdown in the run summary
+
+PROM_WRITE_INTERVAL_S = 10
+
+lock = threading.Lock()
+trace_file = None
+prom_path = None
+run_start_ts = None
+expected_url_count = None
+last_prom_write_ts = 0.0
+
+stage_seconds = collections.defaultdict(float)
+stage_counts = collections.defaultdict(int)
+domain_fetch_seconds = collections.defaultdict(float)
+domain_fetch_counts = collections.defaultdict(int)
+# downloaded_bytes, extracted_chars, audio_seconds
+totals = collections.defaultdict(float)
+url_results = collections.defaultdict(int)  # ok, error, skipped
+
+
+def start_run(metrics_out=None, url_count=None):
+    # metrics_out is a path prefix: we write <prefix>.jsonl and <prefix>.prom.
+    # url_count, when known, lets the progress line estimate time left
+    global trace_file, prom_path, run_start_ts, expected_url_count
+    run_start_ts = time.time()
+    expected_url_count = url_count
+    if metrics_out:
+        metrics_dir = os.path.dirname(os.path.abspath(metrics_out))
+        os.makedirs(metrics_dir, exist_ok=True)
+        trace_file = open(f"{metrics_out}.jsonl", "a", encoding="utf-8")
+        prom_path = f"{metrics_out}.prom"
+
+
+def record_span(url, domains, stage, start_ts, end_ts, **fields):
+    duration_s = end_ts - start_ts
+    with lock:
+        stage_seconds[stage] += duration_s
+        stage_counts[stage] += 1
+        if stage == "fetch":
+            domain_fetch_seconds[domains] += duration_s
+            domain_fetch_counts[domains] += 1
+        for name in ("downloaded_bytes", "extracted_chars", "audio_seconds"):
+            if name in fields:
+                totals[name] += fields[name]
+        if trace_file:
+            span = {
+                "url": url,
+                "domain": domains,
+                "stage": stage,
+                "start": round(start_ts, 6),
+                "duration_s": round(duration_s, 6),
+            }
+            span.update(fields)
+            trace_file.write(json.dumps(span) + "\n")
+
+
+@contextlib.contextmanager
+def timed(url, domains, stage):
+    # yields a dict; whatever the caller puts in it is recorded with the span
+    fields = {}
+    start_ts = time.time()
+    try:
+        yield fields
+    finally:
+        record_span(url, domains, stage, start_ts, time.time(), **fields)
+
+
+def finish_url(result):
+    global last_prom_write_ts
+    with lock:
+        url_results[result] += 1
+    print_progress()
+    if prom_path and time.time() - last_prom_write_ts > PROM_WRITE_INTERVAL_S:
+        write_prom_file()
+        last_prom_write_ts = time.time()
+
+
+def print_progress():
+    if not sys.stderr.isatty():
+        return
+    done_count = sum(url_results.values())
+    elapsed_s = time.time() - run_start_ts
+    line = f"\r{done_count} URLs done ({url_results['error']} problems)"
+    if expected_url_count:
+        remaining_count = max(expected_url_count - done_count, 0)
+        eta_s = elapsed_s / done_count * remaining_count if done_count else 0
+        line = (
+            f"\r{done_count}/{expected_url_count} URLs done"
+            f" ({url_results['error']} problems),"
+            f" {my_time.pretty_print_duration(elapsed_s)} taken,"
+            f" about {my_time.pretty_print_duration(eta_s)} left"
+        )
+    else:
+        line += f", {my_time.pretty_print_duration(elapsed_s)} taken"
+    sys.stderr.write(line.ljust(79))
+    sys.stderr.flush()
+
+
+def get_stage_summary():
+    # e.g. "fetch 01m:10s, extract 00m:12s, synthesize 14m:02s, probe 00m:30s"
+    with lock:
+        return ", ".join(
+            f"{stage} {my_time.pretty_print_duration(seconds)}"
+            for stage, seconds in stage_seconds.items()
+        )
+
+
+def escape_label_value(value):
+    # as the prometheus text format wants it; a domain from a malformed URL could
+    # contain anything
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def write_prom_file():
+    lines = [
+        "# HELP benson_stage_seconds_total Time spent in each stage.",
+        "# TYPE benson_stage_seconds_total counter",
+    ]
+    with lock:
+        for stage, seconds in stage_seconds.items():
+            stage = escape_label_value(stage)
+            lines.append(f'benson_stage_seconds_total{{stage="{stage}"}} {seconds}')
+        lines += [
+            "# HELP benson_stage_spans_total Number of times each stage ran.",
+            "# TYPE benson_stage_spans_total counter",
+        ]
+        for stage, count in stage_counts.items():
+            stage = escape_label_value(stage)
+            lines.append(f'benson_stage_spans_total{{stage="{stage}"}} {count}')
+        lines += [
+            "# HELP benson_domain_fetch_seconds_total Time spent fetching, per domain.",
+            "# TYPE benson_domain_fetch_seconds_total counter",
+        ]
+        for domains, seconds in domain_fetch_seconds.items():
+            domains = escape_label_value(domains)
+            lines.append(
+                f'benson_domain_fetch_seconds_total{{domain="{domains}"}} {seconds}'
+            )
+        lines += [
+            "# HELP benson_domain_fetches_total Number of fetches, per domain.",
+            "# TYPE benson_domain_fetches_total counter",
+        ]
+        for domains, count in domain_fetch_counts.items():
+            domains = escape_label_value(domains)
+            lines.append(f'benson_domain_fetches_total{{domain="{domains}"}} {count}')
+        for name in ("downloaded_bytes", "extracted_chars", "audio_seconds"):
+            lines += [
+                f"# TYPE benson_{name}_total counter",
+                f"benson_{name}_total {totals[name]}",
+            ]
+        lines += [
+            "# HELP benson_urls_total URLs finished, by result.",
+            "# TYPE benson_urls_total counter",
+        ]
+        for result, count in url_results.items():
+            result = escape_label_value(result)
+            lines.append(f'benson_urls_total{{result="{result}"}} {count}')
+        lines += [
+            "# TYPE benson_run_start_timestamp_seconds gauge",
+            f"benson_run_start_timestamp_seconds {run_start_ts}",
+        ]
+
+    # the textfile collector may read at any moment, so swap the file in whole
+    tmp_path = f"{prom_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, prom_path)
+
+
+def finish_run():
+    global trace_file
+    if sys.stderr.isatty():
+        sys.stderr.write("\n")
+    if prom_path:
+        write_prom_file()
+    if trace_file:
+        trace_file.close()
+        trace_file = None
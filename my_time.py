@@ -42,3 +42,13 @@ def pretty_date(dt):
     dts = dt.strftime("%B %d, %Y")
     dts = dts.replace(" 0", " ")
     return dts
+
+
+def parse_iso_date(date_str):
+    # e.g. "2021-05-04", as trafilatura gives dates; None if it isn't one
+    if not date_str:
+        return None
+    try:
+        return datetime.datetime.strptime(date_str[:10], "%Y-%m-%d")
+    except ValueError:
+        return None
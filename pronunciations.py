@@ -0,0 +1,148 @@
+import json
+import os
+import threading
+
+import cache
+import config
+import tts
+
+# how to say a URL's domains in the intro. the curated file (lines like
+# "npr.org en pee are") is compiled into a trie keyed by reversed domain labels,
+# e.g. com -> substack -> astralcodexten, so a lookup walks one node per label and
+# the longest matching suffix wins. the compiled trie is saved next to the source
+# and rebuilt only when the source file changes. site names we learn from the
+# pages' own metadata (see extractor.py) go into a separate file, one per
+# domain, and are reused on later runs
+
+PRON_KEY = ""  # no domain label is empty, so this can't clash with a child node
+
+MAX_LEARNED_NAME_CHARS = 60
+
+lock = threading.Lock()
+trie = {}
+loaded_source = None  # (path, mtime_ns, size) of what's in trie
+learned = None
+
+
+def parse_source(source_path):
+    pronunciations = {}
+    with open(source_path) as f:
+        for ea_line in f.read().splitlines():
+            ea_line = ea_line.strip()
+            if not ea_line or " " not in ea_line:
+                continue
+            fs = ea_line.index(" ")
+            pronunciations[ea_line[:fs].lower()] = ea_line[fs:].strip()
+    return pronunciations
+
+
+def build_trie(pronunciations):
+    root = {}
+    for domains, pron in pronunciations.items():
+        node = root
+        for label in reversed(domains.split(".")):
+            node = node.setdefault(label, {})
+        node[PRON_KEY] = pron
+    return root
+
+
+def load(source_path, write_index=True):
+    # raises OSError if source_path can't be read. a no-op when nothing changed
+    # since the last call, which is what `benson.py serve` relies on. write_index
+    # is False for --plan, which mustn't write anything
+    global trie, loaded_source
+    source_stat = os.stat(source_path)
+    source = (source_path, source_stat.st_mtime_ns, source_stat.st_size)
+    if source == loaded_source:
+        return
+    loaded_source = source
+    index_path = f"{source_path}.index.json"
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+        if (
+            index["mtime_ns"] == source_stat.st_mtime_ns
+            and index["size"] == source_stat.st_size
+        ):
+            trie = index["trie"]
+            return
+    except (OSError, ValueError, KeyError):
+        pass
+
+    trie = build_trie(parse_source(source_path))
+    index = {
+        "mtime_ns": source_stat.st_mtime_ns,
+        "size": source_stat.st_size,
+        "trie": trie,
+    }
+    if not write_index:
+        return
+    try:
+        write_json_atomically(index_path, index)
+    except OSError as e:
+        # the index is only a speedup
+        print(f"could not write domains pronunciation index {index_path}: {e}")
+
+
+def write_json_atomically(full_path, data):
+    cache.write_file_atomically(
+        full_path, json.dumps(data, ensure_ascii=False).encode("utf-8")
+    )
+
+
+def find_longest_suffix(domains):
+    # returns (pronunciation, labels before the matched suffix) or (None, None)
+    labels = domains.split(".")
+    node = trie
+    match = None
+    for depth, label in enumerate(reversed(labels), start=1):
+        node = node.get(label)
+        if node is None:
+            break
+        if PRON_KEY in node:
+            match = (node[PRON_KEY], labels[: len(labels) - depth])
+    return match or (None, None)
+
+
+def get_learned():
+    global learned
+    with lock:
+        if learned is None:
+            try:
+                with open(config.settings["LEARNED_PRONUNCIATIONS_PATH"]) as f:
+                    learned = json.load(f)
+            except (OSError, ValueError):
+                learned = {}
+        return learned
+
+
+def get_domains_pron(domains):
+    pron, leading_labels = find_longest_suffix(domains)
+    if pron is not None and not leading_labels:
+        return pron
+    learned_pron = get_learned().get(domains)
+    if learned_pron:
+        return learned_pron
+    if pron is not None:  # e.g. "someone on Substack", like the curated entries
+        return f"{' dot '.join(leading_labels)} on {pron}"
+    return tts.get_domains_pron(domains)
+
+
+def learn(domains, site_name):
+    site_name = " ".join(site_name.split())
+    if not site_name or len(site_name) > MAX_LEARNED_NAME_CHARS or "/" in site_name:
+        return
+    pron, leading_labels = find_longest_suffix(domains)
+    if pron is not None and not leading_labels:  # curated names always win
+        return
+    get_learned()
+    with lock:
+        if learned.get(domains) == site_name:
+            return
+        learned[domains] = site_name
+        try:
+            write_json_atomically(
+                config.settings["LEARNED_PRONUNCIATIONS_PATH"], learned
+            )
+        except OSError as e:
+            print(f"could not save learned pronunciation for {domains}: {e}")
@@ -0,0 +1,139 @@
+import json
+import threading
+
+import cache
+import config
+
+# the order work is done in. each job's cost is estimated in seconds from what
+# earlier runs saw for its domain: how long fetches took, how long articles are,
+# and how many seconds of audio a character of their text comes out as, times
+# how long the tts engine takes per second of audio. by default the costliest
+# jobs go first (longest processing time first), so that one huge article
+# doesn't start last and keep every other worker waiting for it; quick_wins
+# turns that around, so that short articles are ready as soon as possible
+
+HISTORY_WEIGHT = 0.2  # of a new sample in the moving averages
+DEFAULT_RATES = {
+    "fetch_s": 2.0,
+    "chars": 8000.0,
+    "audio_s_per_char": 0.07,  # about 150 words a minute
+}
+DEFAULT_SYNTHESIS_S_PER_AUDIO_S = 0.1
+
+lock = threading.Lock()
+history = None
+history_changed = False
+
+
+def get_history():
+    # {"domains": {domains: {rate name: moving average}},
+    #  "synthesis_s_per_audio_s": moving average}
+    global history
+    with lock:
+        if history is None:
+            try:
+                with open(config.settings["SCHEDULER_HISTORY_PATH"]) as f:
+                    history = json.load(f)
+            except (OSError, ValueError):
+                history = {}
+            history.setdefault("domains", {})
+        return history
+
+
+def update_average(averages, name, sample):
+    if name in averages:
+        sample = (1 - HISTORY_WEIGHT) * averages[name] + HISTORY_WEIGHT * sample
+    averages[name] = sample
+
+
+def record(domains, **samples):
+    # samples: any of fetch_s, chars, audio_s_per_char
+    global history_changed
+    get_history()
+    with lock:
+        domain_rates = history["domains"].setdefault(domains, {})
+        for name, sample in samples.items():
+            update_average(domain_rates, name, sample)
+        history_changed = True
+
+
+def record_synthesis(synthesis_s, audio_s):
+    global history_changed
+    if audio_s <= 0:
+        return
+    get_history()
+    with lock:
+        update_average(history, "synthesis_s_per_audio_s", synthesis_s / audio_s)
+        history_changed = True
+
+
+def save_history():
+    global history_changed
+    with lock:
+        if not history_changed:
+            return
+        try:
+            cache.write_file_atomically(
+                config.settings["SCHEDULER_HISTORY_PATH"],
+                json.dumps(history).encode("utf-8"),
+            )
+            history_changed = False
+        except OSError as e:
+            print(f"could not save scheduling history: {e}")
+
+
+def get_rate(domains, name):
+    # the domain's own average, else the average over all domains seen, else a
+    # guess
+    get_history()
+    with lock:
+        domain_rates = history["domains"].get(domains, {})
+        if name in domain_rates:
+            return domain_rates[name]
+        samples = [
+            each_rates[name]
+            for each_rates in history["domains"].values()
+            if name in each_rates
+        ]
+    if samples:
+        return sum(samples) / len(samples)
+    return DEFAULT_RATES[name]
+
+
+def estimate_synthesis_s(domains, chars):
+    get_history()
+    synthesis_s_per_audio_s = history.get(
+        "synthesis_s_per_audio_s", DEFAULT_SYNTHESIS_S_PER_AUDIO_S
+    )
+    return chars * get_rate(domains, "audio_s_per_char") * synthesis_s_per_audio_s
+
+
+def estimate_cost(domains):
+    # for a URL that hasn't been fetched yet
+    return get_rate(domains, "fetch_s") + estimate_synthesis_s(
+        domains, get_rate(domains, "chars")
+    )
+
+
+def order_by_cost(costs_and_items, quick_wins=False):
+    ordered = sorted(costs_and_items, key=lambda pair: pair[0], reverse=not quick_wins)
+    return [each_item for cost, each_item in ordered]
+
+
+def schedule(items, window_size, get_cost, quick_wins=False):
+    # reorder each window of items by cost. items that get_cost returns None
+    # for have nothing left to schedule and are passed on right away
+    if not window_size:
+        yield from items
+        return
+    window = []
+    for each_item in items:
+        cost = get_cost(each_item)
+        if cost is None:
+            yield each_item
+            continue
+        window.append((cost, each_item))
+        if len(window) == window_size:
+            yield from order_by_cost(window, quick_wins)
+            window = []
+    yield from order_by_cost(window, quick_wins)
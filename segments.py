@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import config
+import tts
+
+# synthesized audio for the parts of the intro that repeat across articles,
+# e.g. "The next article is from Ars Technica." or the day's date. entries are
+# keyed by the text and the voice settings, laid out like cache.py's entries
+# (<dir>/<first two hex chars>/<key>/) so that cache.evict_lru can bound them
+
+SEGMENT_FILENAME = "segment.wav"
+
+
+def get_segment_key(text):
+    key_source = json.dumps([tts.get_voice_settings(), text], sort_keys=True)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+def get_segment_path(text):
+    key = get_segment_key(text)
+    return os.path.join(
+        config.settings["SEGMENT_CACHE_DIR"], key[:2], key, SEGMENT_FILENAME
+    )
+
+
+def is_enabled():
+    return config.settings["SEGMENT_CACHE_MAX_BYTES"] > 0
+
+
+def load_segment(text):
+    # returns the path of the cached audio for text, or None
+    segment_path = get_segment_path(text)
+    if not os.path.exists(segment_path):
+        return None
+    try:
+        os.utime(os.path.dirname(segment_path))  # what evict_lru goes by
+    except OSError:
+        return None  # evicted just now
+    return segment_path
+
+
+def store_segment(text, audio_path):
+    segment_path = get_segment_path(text)
+    segment_dir = os.path.dirname(segment_path)
+    os.makedirs(segment_dir, exist_ok=True)
+    # tts workers may race on the same segment, so never expose a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=segment_dir)
+    os.close(fd)
+    shutil.copyfile(audio_path, tmp_path)
+    os.replace(tmp_path, segment_path)
@@ -0,0 +1,201 @@
+import collections
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+
+import config
+
+# `--supervise` runs extraction and synthesis in child processes that are
+# watched over: a child is replaced after SUPERVISE_MAX_JOBS_PER_WORKER jobs, or
+# as soon as its RSS passes SUPERVISE_MAX_RSS_MB, so whatever the lxml trees and
+# tts engines leave behind is given back to the OS. a job that runs past its
+# stage's deadline (or whose child dies) gets its child killed and is run again
+# in a new one, up to SUPERVISE_MAX_ATTEMPTS tries in all. SupervisedPool
+# stands in for the ProcessPoolExecutor the stages use otherwise
+
+lock = threading.Lock()
+peak_rss_by_stage = {}  # in bytes
+counts = collections.Counter()  # "recycled", "timed out", "died"
+
+
+def get_rss():
+    # the current resident set size in bytes, or None where /proc isn't there
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_peak_rss():
+    # in bytes, or None on windows
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss
+    return peak_rss * 1024  # linux reports kilobytes
+
+
+def record_peak_rss(stage, peak_rss):
+    if peak_rss is None:
+        return
+    with lock:
+        peak_rss_by_stage[stage] = max(peak_rss, peak_rss_by_stage.get(stage, 0))
+
+
+def get_summary():
+    # e.g. "peak rss main 80 MB, extract 140 MB, synthesize 61 MB; 3 workers
+    # recycled, 1 timeouts, 0 workers died"
+    record_peak_rss("main", get_peak_rss())
+    with lock:
+        rss_summary = ", ".join(
+            f"{stage} {peak_rss / 1_000_000:.0f} MB"
+            for stage, peak_rss in peak_rss_by_stage.items()
+        )
+        return (
+            f"peak rss {rss_summary}; {counts['recycled']} workers recycled,"
+            f" {counts['timed out']} timeouts, {counts['died']} workers died"
+        )
+
+
+def run_worker(conn, initializer, initargs):  # runs in each child process
+    if initializer:
+        initializer(*initargs)
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        fn, args = task
+        try:
+            result = ("ok", fn(*args))
+        except Exception as e:
+            result = ("error", e)
+        try:
+            conn.send(result + (get_rss(), get_peak_rss()))
+        except Exception as e:  # the exception wouldn't pickle
+            conn.send(("error", RuntimeError(str(e)), get_rss(), get_peak_rss()))
+
+
+class SupervisedPool:
+    def __init__(self, stage, max_workers, timeout_s, initializer=None, initargs=()):
+        self.stage = stage
+        self.timeout_s = timeout_s
+        self.initializer = initializer
+        self.initargs = initargs
+        self.tasks = queue.Queue()
+        self.slots = [
+            threading.Thread(target=self.run_slot, daemon=True)
+            for _ in range(max_workers)
+        ]
+        for slot in self.slots:
+            slot.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown(wait=True)
+
+    def submit(self, fn, *args):
+        future = concurrent.futures.Future()
+        self.tasks.put((future, fn, args))
+        return future
+
+    def shutdown(self, wait=True):
+        # what was submitted already still gets done
+        for _ in self.slots:
+            self.tasks.put(None)
+        if wait:
+            for slot in self.slots:
+                slot.join()
+
+    def start_worker(self):
+        # spawn rather than fork, like the executors in benson.py
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=run_worker,
+            args=(child_conn, self.initializer, self.initargs),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return {"process": process, "conn": parent_conn, "job_count": 0}
+
+    def stop_worker(self, worker, kill=False):
+        if not kill:
+            try:
+                worker["conn"].send(None)
+                worker["process"].join(self.timeout_s)
+            except OSError:
+                pass
+        if worker["process"].is_alive():
+            worker["process"].kill()
+        worker["process"].join()
+        worker["conn"].close()
+
+    def run_task(self, worker, fn, args):
+        # returns (status, result or exception, the child's rss afterwards)
+        try:
+            worker["conn"].send((fn, args))
+            if not worker["conn"].poll(self.timeout_s):
+                return "timed out", None, None
+            status, value, rss, peak_rss = worker["conn"].recv()
+        except (EOFError, OSError):
+            return "died", None, None
+        record_peak_rss(self.stage, peak_rss)
+        worker["job_count"] += 1
+        return status, value, rss
+
+    def needs_recycling(self, worker, rss):
+        max_rss = config.settings["SUPERVISE_MAX_RSS_MB"] * 1_000_000
+        if max_rss and rss and rss > max_rss:
+            return True
+        return worker["job_count"] >= config.settings["SUPERVISE_MAX_JOBS_PER_WORKER"]
+
+    def run_slot(self):  # runs in a thread of the parent; one child per slot
+        worker = None
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            for attempt in range(config.settings["SUPERVISE_MAX_ATTEMPTS"]):
+                if worker is None:
+                    worker = self.start_worker()
+                status, value, rss = self.run_task(worker, fn, args)
+                if status in ("ok", "error"):
+                    break
+                with lock:
+                    counts[status] += 1
+                self.stop_worker(worker, kill=True)  # and try again in a new one
+                worker = None
+
+            if status == "ok":
+                future.set_result(value)
+            elif status == "error":
+                future.set_exception(value)
+            elif status == "timed out":
+                future.set_exception(
+                    TimeoutError(f"{self.stage} took more than {self.timeout_s} s")
+                )
+            else:
+                future.set_exception(RuntimeError(f"{self.stage} worker died"))
+
+            if worker and self.needs_recycling(worker, rss):
+                with lock:
+                    counts["recycled"] += 1
+                self.stop_worker(worker)
+                worker = None
+
+        if worker:
+            self.stop_worker(worker)
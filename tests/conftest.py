@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import db_sqlite  # noqa: E402
+
+
+@pytest.fixture
+def queue_db(monkeypatch, tmp_path):
+    # db_sqlite on a fresh database in tmp_path
+    monkeypatch.setitem(
+        vars(config),
+        "settings",
+        {"SQLITE_DB_PATH": str(tmp_path / "queue.sqlite"), "SOURCE_PAGE_SIZE": 100},
+    )
+    monkeypatch.setattr(db_sqlite, "con", None)
+    yield
+    db_sqlite.con.close()
@@ -0,0 +1,69 @@
+import threading
+
+import mysql.connector.errors
+import pytest
+
+import config
+import db
+
+
+class ExhaustedPool:
+    # stands in for MySQLConnectionPool, with a single connection
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.available = 1
+        self.executed = []
+
+    def get_connection(self):
+        with self.lock:
+            if not self.available:
+                raise mysql.connector.errors.PoolError(
+                    "Failed getting connection; pool exhausted"
+                )
+            self.available -= 1
+            return self
+
+    def close(self):
+        with self.lock:
+            self.available += 1
+
+    # the connection's side
+    def cursor(self):
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self.executed += [(sql, params) for params in seq_of_params]
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setitem(
+        vars(config), "settings", {"DB_POOL_WAIT_S": 1, "DB_FLUSH_BATCH_SIZE": 10}
+    )
+    monkeypatch.setattr(db, "pool", ExhaustedPool())
+    return db.pool
+
+
+def test_get_connection_waits_for_a_returned_connection(pool):
+    con = db.get_connection()
+    threading.Timer(0.2, con.close).start()
+    assert db.get_connection() is pool
+
+
+def test_get_connection_gives_up_after_pool_wait(pool):
+    db.get_connection()
+    with pytest.raises(mysql.connector.errors.PoolError):
+        db.get_connection()
+
+
+def test_flush_waits_for_a_connection_held_by_another_thread(pool, monkeypatch):
+    monkeypatch.setattr(db, "flusher_thread", threading.Thread())  # not started
+    db.mark_row_as_processing_error_in_db(7, "duplicate of x")
+    con = db.get_connection()
+    threading.Timer(0.2, con.close).start()
+    db.flush_status_updates()
+    assert pool.executed == [(db.MARK_ERROR_SQL, ("duplicate of x", 7))]
+    assert not db.pending_updates
@@ -0,0 +1,62 @@
+import db_sqlite
+
+# the claim/lease protocol, which db.py runs the same way against MySQL
+
+
+def add_urls(count):
+    db_sqlite.add_urls([f"https://example.com/{i}" for i in range(count)])
+
+
+def get_lease_expires(row_id):
+    with db_sqlite.con_lock:
+        return (
+            db_sqlite.get_connection()
+            .execute("SELECT lease_expires FROM urls WHERE id = ?;", (row_id,))
+            .fetchone()[0]
+        )
+
+
+def get_ids(link_entries):
+    return [each_entry[0] for each_entry in link_entries]
+
+
+def test_workers_claim_disjoint_batches(queue_db):
+    add_urls(5)
+    first_batch = get_ids(db_sqlite.claim_urls("worker-a", 3, 600))
+    second_batch = get_ids(db_sqlite.claim_urls("worker-b", 3, 600))
+    assert first_batch == [1, 2, 3]
+    assert second_batch == [4, 5]
+    assert db_sqlite.claim_urls("worker-c", 3, 600) == []
+
+
+def test_expired_lease_is_claimed_again(queue_db):
+    add_urls(2)
+    assert get_ids(db_sqlite.claim_urls("worker-a", 2, -60)) == [1, 2]
+    assert get_ids(db_sqlite.claim_urls("worker-b", 2, 600)) == [1, 2]
+
+
+def test_renew_leases_pushes_expiry_out(queue_db):
+    add_urls(2)
+    db_sqlite.claim_urls("worker-a", 1, 60)
+    db_sqlite.claim_urls("worker-b", 1, 60)
+    first_expires, second_expires = get_lease_expires(1), get_lease_expires(2)
+    db_sqlite.renew_leases("worker-a", 3600)
+    assert get_lease_expires(1) > first_expires
+    assert get_lease_expires(2) == second_expires  # not worker-a's
+
+
+def test_finished_rows_are_never_claimed(queue_db):
+    add_urls(3)
+    db_sqlite.claim_urls("worker-a", 3, -60)  # leases that have run out
+    db_sqlite.mark_row_as_processed_in_db(1)
+    db_sqlite.mark_row_as_processing_error_in_db(2, "error getting content")
+    assert get_ids(db_sqlite.claim_urls("worker-b", 3, 600)) == [3]
+    assert get_ids(db_sqlite.get_urls_from_db()) == [3]
+
+
+def test_released_rows_are_claimed_again(queue_db):
+    add_urls(2)
+    db_sqlite.claim_urls("worker-a", 2, 600)
+    db_sqlite.mark_row_as_processed_in_db(1)
+    db_sqlite.release_leases("worker-a")
+    assert get_ids(db_sqlite.claim_urls("worker-b", 2, 600)) == [2]
@@ -0,0 +1,137 @@
+import collections
+import http.server
+import threading
+
+import pytest
+
+import config
+import fetcher
+import url_utils
+
+# fetch_hedged against a local origin (127.0.0.1) and a stand-in archive
+# (127.0.0.2, so that it counts as another domain). the origin answers /fast at
+# once, holds /hang until the test is over, and fails /broken with a 500; the
+# archive answers every path with a 200, except those with not-modified in them
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        server.paths[self.path] += 1
+        if server.name == "origin" and self.path == "/hang":
+            server.release.wait(10)
+        if server.name == "origin" and self.path == "/broken":
+            status, body = 500, b""
+        elif "not-modified" in self.path:
+            status, body = 304, b""
+        else:
+            status, body = 200, f"{server.name} copy".encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(name, host):
+    server = http.server.ThreadingHTTPServer((host, 0), FixtureHandler)
+    server.daemon_threads = True
+    server.block_on_close = False
+    server.name = name
+    server.paths = collections.Counter()
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def servers(monkeypatch):
+    origin = start_server("origin", "127.0.0.1")
+    archive = start_server("archive", "127.0.0.2")
+    host, port = archive.server_address[:2]
+    monkeypatch.setitem(
+        vars(config),
+        "settings",
+        {
+            "FETCH_MAX_PER_DOMAIN": 4,
+            "FETCH_USER_AGENT": "benson-tests",
+            "FETCH_TIMEOUT_S": 10,
+            "FETCH_MAX_RETRIES": 0,
+            "FETCH_MAX_BACKOFF_S": 0,
+            "HEDGE_DELAY_S": 1,
+            "CIRCUIT_BREAKER_FAILURES": 2,
+            "CIRCUIT_BREAKER_RESET_S": 600,
+            "ARCHIVE_URL_TEMPLATES": [f"http://{host}:{port}/{{url}}"],
+        },
+    )
+    for name in ("domain_slots", "domain_not_before", "domain_failures"):
+        monkeypatch.setattr(fetcher, name, {})
+    monkeypatch.setattr(fetcher, "http", None)
+    yield origin, archive
+    for server in (origin, archive):
+        server.release.set()
+        server.shutdown()
+        server.server_close()
+
+
+def get_url(server, path):
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}{path}"
+
+
+def test_origin_wins_when_it_answers_before_hedge_delay(servers):
+    origin, archive = servers
+    status, data, headers, source = fetcher.fetch_hedged(get_url(origin, "/fast"))
+    assert (status, data, source) == (200, b"origin copy", "origin")
+    assert not archive.paths
+
+
+def test_archive_wins_when_origin_hangs(servers):
+    origin, archive = servers
+    config.settings["HEDGE_DELAY_S"] = 0.2
+    url = get_url(origin, "/hang")
+    status, data, headers, source = fetcher.fetch_hedged(url)
+    assert (status, data) == (200, b"archive copy")
+    assert source == config.settings["ARCHIVE_URL_TEMPLATES"][0]
+    assert archive.paths[f"/{url}"] == 1
+    # too slow counts against the origin
+    assert fetcher.domain_failures[url_utils.get_domains(url)][0] == 1
+
+
+def test_breaker_opens_after_failures_and_skips_origin(servers):
+    origin, archive = servers
+    url = get_url(origin, "/broken")
+    domains = url_utils.get_domains(url)
+    for _ in range(config.settings["CIRCUIT_BREAKER_FAILURES"]):
+        assert not fetcher.is_circuit_open(domains)
+        assert fetcher.fetch_hedged(url)[1] == b"archive copy"
+    assert fetcher.is_circuit_open(domains)
+    assert origin.paths["/broken"] == config.settings["CIRCUIT_BREAKER_FAILURES"]
+
+    assert fetcher.fetch_hedged(url)[1] == b"archive copy"
+    assert origin.paths["/broken"] == config.settings["CIRCUIT_BREAKER_FAILURES"]
+
+
+def test_fetch_archived_rejects_304(servers):
+    origin, archive = servers
+    url = get_url(origin, "/not-modified")
+    status, data, headers = fetcher.fetch_archived(
+        url, config.settings["ARCHIVE_URL_TEMPLATES"][0]
+    )
+    assert archive.paths[f"/{url}"] == 1
+    assert status == 0
+    assert not fetcher.is_usable(status, data)
+
+
+def test_without_archives_origin_is_always_asked(servers):
+    origin, archive = servers
+    config.settings["ARCHIVE_URL_TEMPLATES"] = []
+    url = get_url(origin, "/broken")
+    for _ in range(config.settings["CIRCUIT_BREAKER_FAILURES"] + 1):
+        assert fetcher.fetch_hedged(url)[0] == 500
+    assert origin.paths["/broken"] == config.settings["CIRCUIT_BREAKER_FAILURES"] + 1
+    assert not archive.paths
@@ -0,0 +1,25 @@
+import os
+
+import db_sqlite
+import intake
+
+
+def get_queued_urls():
+    with db_sqlite.con_lock:
+        rows = db_sqlite.get_connection().execute("SELECT url FROM urls;").fetchall()
+    return [row[0] for row in rows]
+
+
+def test_unreadable_spool_file_is_moved_to_failed(queue_db, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    (spool_dir / "bad.txt").write_bytes(b"\xff\xfe")
+    (spool_dir / "good.txt").write_text(
+        "https://example.com/a\n\nhttps://example.com/b\n"
+    )
+
+    assert intake.ingest_spool(str(spool_dir)) == 2
+    assert get_queued_urls() == ["https://example.com/a", "https://example.com/b"]
+    assert os.listdir(spool_dir / "failed") == ["bad.txt"]
+    assert os.listdir(spool_dir / "done") == ["good.txt"]
+    assert sorted(os.listdir(spool_dir)) == ["done", "failed"]
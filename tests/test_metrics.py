@@ -0,0 +1,18 @@
+import collections
+
+import metrics
+
+
+def test_prom_file_escapes_label_values(monkeypatch, tmp_path):
+    prom_path = tmp_path / "run.prom"
+    monkeypatch.setattr(metrics, "prom_path", str(prom_path))
+    domain_fetch_counts = collections.defaultdict(int)
+    domain_fetch_counts['evil"host\\name\nexample.com'] = 2
+    monkeypatch.setattr(metrics, "domain_fetch_counts", domain_fetch_counts)
+
+    metrics.write_prom_file()
+    lines = prom_path.read_text(encoding="utf-8").splitlines()
+    assert (
+        'benson_domain_fetches_total{domain="evil\\"host\\\\name\\nexample.com"} 2'
+        in lines
+    )
@@ -0,0 +1,111 @@
+import http.server
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import benchmark
+
+# full runs against a local server. /story/one names /story/one/ as its
+# rel=canonical; /guitar/amp?ref=home is only served under exactly that URL
+
+
+class CanonicalHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path not in ("/story/one", "/guitar/amp?ref=home"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = benchmark.make_article_html(1).replace(
+            b"<head>", b'<head><link rel="canonical" href="/story/one/">'
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), CanonicalHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run_benson(work_dir, *args):
+    completed = subprocess.run(
+        [sys.executable, os.path.join(benchmark.REPO_DIR, "benson.py")]
+        + ["--source", "urls.txt", *args],
+        cwd=work_dir,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+    return completed.stdout
+
+
+def test_rerun_skips_page_with_rel_canonical(server, tmp_path):
+    benchmark.make_work_dir(str(tmp_path), server, {"TTS_STUB_CHARS_PER_S": 0})
+    host, port = server.server_address[:2]
+    (tmp_path / "urls.txt").write_text(f"http://{host}:{port}/story/one\n")
+
+    first_run = run_benson(tmp_path)
+    assert "mp3s count:    1" in first_run
+    second_run = run_benson(tmp_path)
+    assert "mp3s count:    0" in second_run
+    assert "skipped URLs:  1" in second_run
+    assert "duplicates:    0" in second_run
+    assert "same text as" not in second_run
+
+
+def test_fetches_url_as_listed(server, tmp_path):
+    # its canonical form, without the amp suffix and the ref parameter, is 404
+    benchmark.make_work_dir(str(tmp_path), server, {"TTS_STUB_CHARS_PER_S": 0})
+    host, port = server.server_address[:2]
+    (tmp_path / "urls.txt").write_text(f"http://{host}:{port}/guitar/amp?ref=home\n")
+
+    run = run_benson(tmp_path)
+    assert "mp3s count:    1" in run
+    assert "problem URLs:  0" in run
+
+
+def test_from_cache_rerenders_finished_urls(server, tmp_path):
+    benchmark.make_work_dir(str(tmp_path), server, {"TTS_STUB_CHARS_PER_S": 0})
+    host, port = server.server_address[:2]
+    (tmp_path / "urls.txt").write_text(f"http://{host}:{port}/story/one\n")
+
+    run_benson(tmp_path)
+    server.shutdown()  # re-rendering mustn't need the network
+    rerun = run_benson(tmp_path, "--from-cache")
+    assert "mp3s count:    1" in rerun
+    assert "skipped URLs:  0" in rerun
+
+
+def test_plan_only_reads(server, tmp_path):
+    benchmark.make_work_dir(str(tmp_path), server, {"TTS_STUB_CHARS_PER_S": 0})
+    host, port = server.server_address[:2]
+    (tmp_path / "urls.txt").write_text(f"http://{host}:{port}/story/one\n")
+
+    files_before = sorted(os.listdir(tmp_path))
+    plan = run_benson(tmp_path, "--plan")
+    assert "1 new" in plan
+    assert sorted(os.listdir(tmp_path)) == files_before
+
+    run_benson(tmp_path)
+    journal_mtime_ns = (tmp_path / "journal.sqlite").stat().st_mtime_ns
+    plan = run_benson(tmp_path, "--plan")
+    assert "1 already done" in plan
+    assert (tmp_path / "journal.sqlite").stat().st_mtime_ns == journal_mtime_ns
@@ -1,26 +1,25 @@
 import hashlib
-import yaml
+import re
 
 import url_utils
 import config
 
+paragraph_end = re.compile(r"\n+")
+sentence_end = re.compile(r"(?<=[.!?])\s+")
 
-def tokenize_string(string):
-    tokens = []
-    cur_token = ""
 
-    for char in string:
-        if char in config.settings["ALLOWED_AN_CHARS"]:
-            cur_token += char
-        else:
-            if cur_token:
-                tokens.append(cur_token)
-                cur_token = ""
-            else:
-                pass
-    if cur_token:
-        tokens.append(cur_token)
-    return tokens
+# matches runs of ALLOWED_AN_CHARS; built on first use
+allowed_run = None
+
+
+def tokenize_string(string):
+    global allowed_run
+    if allowed_run is None:
+        allowed_chars = config.settings["ALLOWED_AN_CHARS"]
+        if not allowed_chars:
+            return []
+        allowed_run = re.compile(f"[{re.escape(allowed_chars)}]+")
+    return allowed_run.findall(string)
 
 
 def get_base_filename(url):
@@ -29,3 +28,45 @@ def get_base_filename(url):
     tokens.append(md5)
     base_filename = "-".join(tokens)
     return base_filename
+
+
+def get_content_hash(text):
+    # the same article reached by different URLs may differ in whitespace or case
+    normalized_text = " ".join(text.split()).lower()
+    return hashlib.sha256(normalized_text.encode("utf-8")).hexdigest()
+
+
+def split_after(pattern, string):
+    # like re.split, but each separator stays attached to the piece before it
+    pieces = []
+    start = 0
+    for match in pattern.finditer(string):
+        pieces.append(string[start : match.end()])
+        start = match.end()
+    if start < len(string):
+        pieces.append(string[start:])
+    return pieces
+
+
+def split_into_chunks(text, max_chars):
+    # break text at paragraph boundaries, or at sentence boundaries for paragraphs
+    # longer than max_chars, and pack the pieces greedily into chunks of at most
+    # max_chars. a single sentence longer than max_chars becomes its own chunk.
+    # "".join(chunks) == text
+    pieces = []
+    for paragraph in split_after(paragraph_end, text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(split_after(sentence_end, paragraph))
+
+    chunks = []
+    cur_chunk = ""
+    for piece in pieces:
+        if cur_chunk and len(cur_chunk) + len(piece) > max_chars:
+            chunks.append(cur_chunk)
+            cur_chunk = ""
+        cur_chunk += piece
+    if cur_chunk:
+        chunks.append(cur_chunk)
+    return chunks
@@ -1,14 +1,77 @@
-import pyttsx3
 import re
 import datetime
+import importlib
+
+import config
 import my_time
 
-# initialize and configure TTS processor
-engine = pyttsx3.init()
-# engine.setProperty(  # commented this out to be non-Windows friendly
-#     "voice",
-#     "HKEY_LOCAL_MACHINE\SOFTWARE\Microsoft\Speech\Voices\Tokens\TTS_MS_EN-US_DAVID_11.0",
-# )
+# synthesis is done by the backend that TTS_ENGINE names. each backend is a
+# module with start() (load the engine ahead of the first text),
+# synthesize_to_file(), synthesize_to_stream() (wav bytes to a binary file
+# object) and synthesize_batch() (a list of (text, path), returning an
+# exception or None for each), plus PARALLEL_IN_THREADS, which says whether
+# calls may run in several threads of one process at once. only the chosen
+# backend is imported
+BACKEND_MODULES = {
+    "pyttsx3": "tts_pyttsx3",
+    "espeak-ng": "tts_espeak",
+    "stub": "tts_stub",
+}
+
+
+def get_backend():
+    return importlib.import_module(BACKEND_MODULES[config.settings["TTS_ENGINE"]])
+
+
+def start():
+    get_backend().start()
+
+
+def can_run_in_threads():
+    return get_backend().PARALLEL_IN_THREADS
+
+
+def get_voice_settings():
+    # everything that changes how a given text sounds; audio synthesized under
+    # other voice settings must not be reused
+    return {
+        "engine": config.settings["TTS_ENGINE"],
+        "voice": config.settings["TTS_VOICE"],
+        "rate": config.settings["TTS_RATE"],
+    }
+
+
+def synthesize_to_file(text, full_path):
+    get_backend().synthesize_to_file(text, full_path)
+
+
+def synthesize_to_stream(text, out_file):
+    get_backend().synthesize_to_stream(text, out_file)
+
+
+def synthesize_batch(texts_and_paths):
+    return get_backend().synthesize_batch(texts_and_paths)
+
+
+last_millennium = re.compile(r"\b1[89]\d\d\b")
+this_millennium = re.compile(r"\b20[012]\d\b")
+a_month = re.compile(r"\b\d\d?\b")
+a_day = re.compile(r"\b\d\d?\b")
+
+months = [
+    "January",
+    "February",
+    "March",
+    "April",
+    "May",
+    "June",
+    "July",
+    "August",
+    "September",
+    "October",
+    "November",
+    "December",
+]
 
 
 def get_spoken_title(domains, path_as_tokens):
@@ -20,12 +83,8 @@ def get_spoken_title(domains, path_as_tokens):
         return "(no path)"
 
     # first, try to extract any publication date data that may be in the path
-    last_millennium = re.compile(r"\b1[89]\d\d\b")
-    this_millennium = re.compile(r"\b20[012]\d\b")
-    a_month = re.compile(r"\b\d\d?\b")
-    a_day = re.compile(r"\b\d\d?\b")
-
     possible_pub_dates = []
+    this_year = datetime.datetime.now().year
 
     for i, v in enumerate(path_as_tokens):
 
@@ -50,7 +109,7 @@ def get_spoken_title(domains, path_as_tokens):
         if not candidate_pub_year:
             continue
 
-        if candidate_pub_year > datetime.datetime.now().year:
+        if candidate_pub_year > this_year:
             # publication year can't be in the future
             continue
         else:
@@ -63,7 +122,7 @@ def get_spoken_title(domains, path_as_tokens):
         else:
             candidate_pub_month = None
 
-        if candidate_pub_day and 1 <= candidate_pub_day <= 31:
+        if candidate_pub_month and candidate_pub_day and 1 <= candidate_pub_day <= 31:
             # we have a probable pub day!
             pass
         else:
@@ -75,20 +134,6 @@ def get_spoken_title(domains, path_as_tokens):
             continue
 
         if candidate_pub_month and not candidate_pub_day:
-            months = [
-                "January",
-                "February",
-                "March",
-                "April",
-                "May",
-                "June",
-                "July",
-                "August",
-                "September",
-                "October",
-                "November",
-                "December",
-            ]
             pub_date_str = f"{months[candidate_pub_month - 1]} {candidate_pub_year}"
 
             possible_pub_dates.append((pub_date_str, i))
@@ -0,0 +1,131 @@
+import concurrent.futures
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+
+import config
+
+# drives espeak-ng directly: the text goes in on stdin and the wav comes back
+# on stdout as it's synthesized. espeak-ng can't mark where one text's audio
+# ends on a shared stdout, so rather than keeping processes alive, the pool is
+# a cap of ESPEAK_PROCESSES processes running at once, started per call (which
+# takes milliseconds). calls are safe from any thread, so a single python
+# process can keep several espeak-ng processes busy
+
+PARALLEL_IN_THREADS = True
+
+READ_BYTES = 1 << 16
+WAV_HEADER_BYTES = 44  # what espeak-ng writes: RIFF, a 16-byte fmt chunk, data
+
+process_slots = None
+slots_lock = threading.Lock()
+
+
+def get_process_slots():
+    global process_slots
+    with slots_lock:
+        if process_slots is None:
+            process_slots = threading.BoundedSemaphore(
+                config.settings["ESPEAK_PROCESSES"]
+            )
+        return process_slots
+
+
+def get_command():
+    command = [config.settings["ESPEAK_PATH"], "--stdin", "--stdout", "-b", "1"]
+    if config.settings["TTS_VOICE"]:
+        command += ["-v", str(config.settings["TTS_VOICE"])]
+    if config.settings["TTS_RATE"]:
+        command += ["-s", str(config.settings["TTS_RATE"])]
+    return command
+
+
+def start():
+    if not shutil.which(config.settings["ESPEAK_PATH"]):
+        raise RuntimeError(f"{config.settings['ESPEAK_PATH']} not found")
+
+
+def write_text(stdin, text):  # runs in its own thread, so stdout never backs up
+    try:
+        stdin.write(text.encode("utf-8"))
+        stdin.close()
+    except BrokenPipeError:
+        pass  # espeak-ng quit early; its exit code says why
+
+
+def synthesize_to_stream(text, out_file):
+    # writes the wav to out_file as espeak-ng produces it. raises TimeoutError
+    # when espeak-ng takes more than ESPEAK_TIMEOUT_S
+    timeout_s = config.settings["ESPEAK_TIMEOUT_S"]
+    with get_process_slots(), tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(
+            get_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            start_new_session=True,  # ctrl-c is for benson, see benson.serve()
+        )
+        timed_out = threading.Event()
+
+        def kill_on_timeout():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout_s, kill_on_timeout)
+        timer.start()
+        writer = threading.Thread(
+            target=write_text, args=(process.stdin, text), daemon=True
+        )
+        writer.start()
+        try:
+            while data := process.stdout.read(READ_BYTES):
+                out_file.write(data)
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            if process.poll() is None:  # out_file.write failed
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            writer.join()
+
+        if timed_out.is_set():
+            raise TimeoutError(f"espeak-ng took more than {timeout_s} s")
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr_text = stderr_file.read().decode("utf-8", errors="replace")
+            raise RuntimeError(f"espeak-ng failed: {stderr_text.strip()}")
+
+
+def fix_wav_sizes(full_path):
+    # espeak-ng can't seek back on a pipe to fill in the sizes in the header
+    with open(full_path, "r+b") as f:
+        header = f.read(WAV_HEADER_BYTES)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE" or header[36:40] != b"data":
+            return
+        file_size = f.seek(0, os.SEEK_END)
+        f.seek(4)
+        f.write(struct.pack("<I", file_size - 8))
+        f.seek(40)
+        f.write(struct.pack("<I", file_size - WAV_HEADER_BYTES))
+
+
+def synthesize_to_file(text, full_path):
+    with open(full_path, "wb") as f:
+        synthesize_to_stream(text, f)
+    fix_wav_sizes(full_path)
+
+
+def synthesize_batch(texts_and_paths):
+    # up to ESPEAK_PROCESSES at once
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=config.settings["ESPEAK_PROCESSES"]
+    ) as executor:
+        futures = [
+            executor.submit(synthesize_to_file, text, full_path)
+            for text, full_path in texts_and_paths
+        ]
+    return [future.exception() for future in futures]
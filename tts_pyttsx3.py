@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+
+import config
+
+# the default tts backend. pyttsx3 drives the platform's speech engine (sapi5,
+# nsss or espeak) through an event loop that isn't safe to share between
+# threads, so parallel synthesis needs separate processes (see
+# benson.make_tts_executor). the engine is initialized on first use, so that
+# each tts worker process ends up with its own
+
+PARALLEL_IN_THREADS = False
+
+engine = None
+
+
+def get_engine():
+    global engine
+    if engine is None:
+        import pyttsx3  # only loaded by processes that actually synthesize
+
+        engine = pyttsx3.init()
+        # engine.setProperty(  # commented this out to be non-Windows friendly
+        #     "voice",
+        #     "HKEY_LOCAL_MACHINE\SOFTWARE\Microsoft\Speech\Voices\Tokens\TTS_MS_EN-US_DAVID_11.0",
+        # )
+        if config.settings["TTS_VOICE"]:
+            engine.setProperty("voice", config.settings["TTS_VOICE"])
+        if config.settings["TTS_RATE"]:
+            engine.setProperty("rate", config.settings["TTS_RATE"])
+    return engine
+
+
+def start():
+    get_engine()
+
+
+def synthesize_to_file(text, full_path):
+    get_engine().save_to_file(text, full_path)
+    get_engine().runAndWait()
+
+
+def synthesize_to_stream(text, out_file):
+    # pyttsx3 can only write files, so go through one
+    fd, tmp_path = tempfile.mkstemp(prefix="benson-", suffix=".wav")
+    os.close(fd)
+    try:
+        synthesize_to_file(text, tmp_path)
+        with open(tmp_path, "rb") as f:
+            shutil.copyfileobj(f, out_file)
+    finally:
+        os.remove(tmp_path)
+
+
+def synthesize_batch(texts_and_paths):
+    # queues everything and runs the event loop once
+    for text, full_path in texts_and_paths:
+        get_engine().save_to_file(text, full_path)
+    try:
+        get_engine().runAndWait()
+    except Exception as e:
+        return [e] * len(texts_and_paths)
+    return [None] * len(texts_and_paths)
@@ -0,0 +1,50 @@
+import io
+import time
+import wave
+
+import config
+
+# a fake tts backend that stands in for pyttsx3 in benchmarks: it writes a
+# silent wav whose length depends only on the text, and takes
+# TTS_STUB_CHARS_PER_S to do it. like pyttsx3, it's run in worker processes
+
+PARALLEL_IN_THREADS = False
+
+STUB_FRAME_RATE = 8_000
+STUB_FRAMES_PER_CHAR = 500  # roughly the pace of speech
+
+
+def start():
+    pass
+
+
+def write_stub_audio(text, f):
+    chars_per_s = config.settings["TTS_STUB_CHARS_PER_S"]
+    if chars_per_s:
+        time.sleep(len(text) / chars_per_s)
+    with wave.open(f, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(STUB_FRAME_RATE)
+        wav_file.writeframes(b"\0\0" * (STUB_FRAMES_PER_CHAR * len(text)))
+
+
+def synthesize_to_file(text, full_path):
+    write_stub_audio(text, full_path)
+
+
+def synthesize_to_stream(text, out_file):
+    buffer = io.BytesIO()  # the wave module seeks back to finish the header
+    write_stub_audio(text, buffer)
+    out_file.write(buffer.getvalue())
+
+
+def synthesize_batch(texts_and_paths):
+    errors = []
+    for text, full_path in texts_and_paths:
+        try:
+            synthesize_to_file(text, full_path)
+            errors.append(None)
+        except Exception as e:
+            errors.append(e)
+    return errors
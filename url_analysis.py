@@ -0,0 +1,26 @@
+import text_utils
+import tts
+import url_utils
+
+# the per-URL metadata benson derives before fetching anything, for one URL or
+# streamed over any number of them (e.g., when preflighting a large archive of
+# saved links). results match calling the underlying functions one by one
+
+
+def analyze_url(url):
+    domains = url_utils.get_domains(url)
+    path = url_utils.get_path_of_url(url, domains)
+    path_as_tokens = url_utils.trim_path_tokens(text_utils.tokenize_string(path))
+    return {
+        "url": url,
+        "domains": domains,
+        "path_as_tokens": path_as_tokens,
+        # get_spoken_title pops date tokens, so hand it a copy
+        "spoken_title": tts.get_spoken_title(domains, path_as_tokens[:]),
+        "base_filename": text_utils.get_base_filename(url),
+    }
+
+
+def analyze_urls(urls):
+    for url in urls:
+        yield analyze_url(url)
@@ -1,5 +1,8 @@
+import fnmatch
+import html
+import ipaddress
 import re
-import yaml
+import urllib.parse
 
 import text_utils
 import config
@@ -29,102 +32,93 @@ def tokenize_url(url):
 def get_domains(url: str):
     url = trim_url(url)
 
-    try:  # remove path symbol (i.e., forward slash) and remainder of string
-        iofs = url.index("/")
-        url = url[:iofs]
-    except:
-        pass
-
-    try:  # remove percent-encoded path symbol (i.e., forward slash) and remainder of string
-        iofs = url.index("%2F")
-        url = url[:iofs]
-    except:
-        pass
-
-    try:  # remove query marker (i.e., question mark) and remainder of string
-        ioqm = url.index("?")
-        url = url[:ioqm]
-    except:
-        pass
-
-    try:  # remove percent-encoded query marker (i.e., question mark) and remainder of string
-        iofs = url.index("%3F")
-        url = url[:iofs]
-    except:
-        pass
-
-    try:  # remove port number symbol and remainder of string
-        ioc = url.index(":")
-        url = url[:ioc]
-    except:
-        pass
+    # cut at the first path symbol (i.e., forward slash), percent-encoded path
+    # symbol, query marker (i.e., question mark), percent-encoded query marker,
+    # and port number symbol, in that order
+    url = url.partition("/")[0]
+    url = url.partition("%2F")[0]
+    url = url.partition("?")[0]
+    url = url.partition("%3F")[0]
+    url = url.partition(":")[0]
 
     domains = url
     return domains
 
 
-def trim_path_tokens(path_as_tokens):
-    # discard leading tokens likely to be irrelevant
-    while (
-        path_as_tokens
-        and path_as_tokens[0] in config.settings["IRRELEVANT_FIRST_TOKENS"]
-    ):
-        path_as_tokens.pop(0)
+int_min5 = re.compile(r"\b\d{5,}\b")
+date_string = re.compile(r"\b20\d\d\d\d\d\d\b")
 
-    int_min5 = re.compile(r"\b\d{5,}\b")
-    date_string = re.compile(r"\b20\d\d\d\d\d\d\b")
+int_4exact = re.compile(r"\b\d{4}\b")
+second_millennium = re.compile(r"\b1[0-9]\d\d\b")
+year_2000s_2010s = re.compile(r"\b20[01]\d\b")
+year_2020s = re.compile(r"\b202[012]\b")
 
-    int_4exact = re.compile(r"\b\d{4}\b")
-    second_millennium = re.compile(r"\b1[0-9]\d\d\b")
-    year_2000s_2010s = re.compile(r"\b20[01]\d\b")
-    year_2020s = re.compile(r"\b202[012]\b")
+hex_string_min4 = re.compile(r"\b[a-f0-9]{4,}\b")
+all_digits = re.compile(r"\b\d+\b")
+all_letters = re.compile(r"\b[a-z]+\b")
 
-    hex_string_min4 = re.compile(r"\b[a-f0-9]{4,}\b")
-    all_digits = re.compile(r"\b\d+\b")
-    all_letters = re.compile(r"\b[a-z]+\b")
+alphanumeric_str_min8 = re.compile(r"\b[a-z0-9]{8,}\b")
 
-    alphanumeric_str_min8 = re.compile(r"\b[a-z0-9]{8,}\b")
+# the token lists from settings.yaml as sets, built on first use
+token_sets = None
 
-    # discard final tokens likely to be irrelevant
-    while path_as_tokens and (
-        (
-            path_as_tokens[len(path_as_tokens) - 1]
-            in config.settings["IRRELEVANT_LAST_TOKENS"]
-        )
-        or (
-            int_4exact.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not date_string.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not year_2020s.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not year_2000s_2010s.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not second_millennium.match(path_as_tokens[len(path_as_tokens) - 1])
+
+def get_token_sets():
+    global token_sets
+    if token_sets is None:
+        token_sets = (
+            frozenset(config.settings["IRRELEVANT_FIRST_TOKENS"]),
+            frozenset(config.settings["IRRELEVANT_LAST_TOKENS"]),
+            frozenset(config.settings["IRRELEVANT_TOKENS"]),
         )
+    return token_sets
+
+
+def is_irrelevant_last_token(token, irrelevant_last_tokens):
+    return (
+        (token in irrelevant_last_tokens)
         or (
-            int_min5.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not date_string.match(path_as_tokens[len(path_as_tokens) - 1])
+            int_4exact.match(token)
+            and not date_string.match(token)
+            and not year_2020s.match(token)
+            and not year_2000s_2010s.match(token)
+            and not second_millennium.match(token)
         )
+        or (int_min5.match(token) and not date_string.match(token))
         or (
-            hex_string_min4.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not all_digits.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not all_letters.match(path_as_tokens[len(path_as_tokens) - 1])
+            hex_string_min4.match(token)
+            and not all_digits.match(token)
+            and not all_letters.match(token)
         )
         or (
-            alphanumeric_str_min8.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not all_digits.match(path_as_tokens[len(path_as_tokens) - 1])
-            and not all_letters.match(path_as_tokens[len(path_as_tokens) - 1])
+            alphanumeric_str_min8.match(token)
+            and not all_digits.match(token)
+            and not all_letters.match(token)
         )
-    ):
-        # logger.info(f"deleting: {path_as_tokens[len(path_as_tokens) - 1]}")
-        path_as_tokens.pop(len(path_as_tokens) - 1)
+    )
 
-    new_path_as_tokens = []
-    for token in path_as_tokens:
-        if token not in config.settings["IRRELEVANT_TOKENS"]:
-            new_path_as_tokens.append(token)
 
-    if new_path_as_tokens:
-        return new_path_as_tokens
-    else:
-        return []
+def trim_path_tokens(path_as_tokens):
+    token_sets = get_token_sets()
+    irrelevant_first_tokens, irrelevant_last_tokens, irrelevant_tokens = token_sets
+
+    # discard leading tokens likely to be irrelevant
+    start = 0
+    num_tokens = len(path_as_tokens)
+    while start < num_tokens and path_as_tokens[start] in irrelevant_first_tokens:
+        start += 1
+
+    # discard final tokens likely to be irrelevant
+    end = num_tokens
+    while end > start and is_irrelevant_last_token(
+        path_as_tokens[end - 1], irrelevant_last_tokens
+    ):
+        # logger.info(f"deleting: {path_as_tokens[end - 1]}")
+        end -= 1
+
+    return [
+        token for token in path_as_tokens[start:end] if token not in irrelevant_tokens
+    ]
 
 
 def get_path_of_url(url, domains):
@@ -136,3 +130,118 @@ def get_path_of_url(url, domains):
         return path_as_str[1:]
     else:
         return path_as_str
+
+
+def normalize_url(url):
+    # lowercase the scheme and host, drop default ports and the fragment. path
+    # and query are case-sensitive on most servers, so they're left alone
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (
+        scheme == "https" and netloc.endswith(":443")
+    ):
+        netloc = netloc[: netloc.rindex(":")]
+    path = parts.path or "/"
+    return urllib.parse.urlunsplit((scheme, netloc, path, parts.query, ""))
+
+
+# how the same article shows up under different URLs: tracking parameters, AMP
+# variants and http vs https. canonicalize_url folds those together, so that
+# each article is fetched, named and synthesized once
+stripped_query_param = None
+
+
+def is_stripped_query_param(name):
+    # STRIP_QUERY_PARAMS holds shell-style patterns such as "utm_*"
+    global stripped_query_param
+    if stripped_query_param is None:
+        stripped_query_param = re.compile(
+            "|".join(
+                fnmatch.translate(pattern.lower())
+                for pattern in config.settings["STRIP_QUERY_PARAMS"]
+            )
+            or r"(?!)"
+        )
+    return stripped_query_param.match(urllib.parse.unquote_plus(name).lower())
+
+
+def is_local_host(host):
+    if host == "localhost":
+        return True
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+        return True
+    except ValueError:
+        return False
+
+
+def canonicalize_url(url):
+    parts = urllib.parse.urlsplit(normalize_url(url))
+    scheme, netloc, path, query = parts.scheme, parts.netloc, parts.path, parts.query
+
+    # Google's AMP cache, e.g. https://example-com.cdn.ampproject.org/c/s/example.com/a
+    if netloc.endswith(".cdn.ampproject.org") and path.startswith("/c/"):
+        cached_path = path[len("/c/") :]
+        if cached_path.startswith("s/"):
+            cached_path = cached_path[len("s/") :]
+        else:
+            scheme = "http"
+        netloc, _, path = cached_path.partition("/")
+        return canonicalize_url(
+            urllib.parse.urlunsplit((scheme, netloc, "/" + path, query, ""))
+        )
+
+    if netloc.startswith("amp."):
+        netloc = netloc[len("amp.") :]
+    for amp_suffix in ("/amp", "/amp/"):
+        if path.endswith(amp_suffix) and len(path) > len(amp_suffix):
+            path = path[: -len(amp_suffix)]
+            break
+
+    # only a default port can be assumed to serve https as well
+    if (
+        scheme == "http"
+        and config.settings["UPGRADE_TO_HTTPS"]
+        and ":" not in netloc
+        and not is_local_host(netloc)
+    ):
+        scheme = "https"
+
+    # the raw query pieces are kept as they were, rather than re-encoded
+    query = "&".join(
+        each_param
+        for each_param in query.split("&")
+        if each_param and not is_stripped_query_param(each_param.partition("=")[0])
+    )
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ""))
+
+
+rel_canonical_link = re.compile(
+    rb"<link\s[^>]*?rel=[\"']?canonical[\"']?[^>]*>", re.IGNORECASE
+)
+link_href = re.compile(rb"href=[\"']([^\"'<>]+)[\"']", re.IGNORECASE)
+
+
+def find_rel_canonical(html_bytes, url):
+    # the canonical URL a page names for itself, if it's on the same site
+    link_match = rel_canonical_link.search(html_bytes)
+    if not link_match:
+        return None
+    href_match = link_href.search(link_match.group(0))
+    if not href_match:
+        return None
+    href = html.unescape(href_match.group(1).decode("utf-8", errors="ignore"))
+    canonical_url = canonicalize_url(urllib.parse.urljoin(url, href.strip()))
+    if not canonical_url.startswith(("http://", "https://")):
+        return None
+    # e.g. amp.example.com may point to example.com, but not to another site
+    domains = get_domains(url.lower())
+    canonical_domains = get_domains(canonical_url.lower())
+    if not (
+        domains == canonical_domains
+        or domains.endswith("." + canonical_domains)
+        or canonical_domains.endswith("." + domains)
+    ):
+        return None
+    return canonical_url